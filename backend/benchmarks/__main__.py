@@ -0,0 +1,93 @@
+"""
+Runs the import and API benchmarks on synthetic data, fully offline, and compares saved results.
+Usage:
+    python -m benchmarks run [--output results.json] [--only import|api]
+    python -m benchmarks compare OLD.json NEW.json [--threshold 0.1]
+"""
+
+import sys
+import tempfile
+
+import click
+
+from benchmarks import results as results_module
+from benchmarks.api import run_api_benchmarks
+from benchmarks.imports import run_import_benchmarks
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option("--output", "-o", default=None, help="JSON file to save the results to.")
+@click.option("--only", type=click.Choice(["import", "api"]), default=None)
+@click.option("--drafts", default=2000, show_default=True, help="Drafts in the file used for the import.")
+@click.option("--cards", default=250, show_default=True, help="Different cards in the synthetic set.")
+@click.option("--count", default=200, show_default=True, help="Drafts to import.")
+@click.option("--workers", type=int, default=None, help="Processes used for sampling (all CPUs by default).")
+@click.option("--repeat", default=3, show_default=True, help="The best of this many runs is reported.")
+@click.option("--api-drafts", default=200, show_default=True, help="Drafts in the API database.")
+@click.option("--requests", "request_count", default=500, show_default=True, help="Requests per endpoint.")
+@click.option("--concurrency", default=8, show_default=True, help="Requests sent at the same time.")
+@click.option("--db-url", default=None, help="Database for the API (a temporary SQLite file by default).")
+def run(output, only, drafts, cards, count, workers, repeat, api_drafts, request_count, concurrency, db_url):
+    """
+    Runs the benchmarks. The results of different commits are comparable if the options are the same.
+    """
+
+    parameters = {
+        "drafts": drafts,
+        "cards": cards,
+        "count": count,
+        "workers": workers,
+        "api_drafts": api_drafts,
+        "requests": request_count,
+        "concurrency": concurrency,
+        "db": db_url.split(":")[0] if db_url else "sqlite",
+    }
+    results = results_module.Results(parameters)
+    with tempfile.TemporaryDirectory(prefix="8pack-benchmarks-") as workdir:
+        if only in (None, "import"):
+            click.echo("Running the import benchmarks...", err=True)
+            run_import_benchmarks(
+                results, workdir, drafts=drafts, cards=cards, count=count, workers=workers, repeat=repeat
+            )
+        if only in (None, "api"):
+            click.echo("Running the API benchmarks...", err=True)
+            run_api_benchmarks(
+                results,
+                workdir,
+                db_url=db_url,
+                drafts=api_drafts,
+                cards=cards,
+                count=request_count,
+                concurrency=concurrency,
+            )
+
+    for name, metrics in results.benchmarks.items():
+        click.echo(f"{name:<28} " + ", ".join(f"{k}={v:.3f}" for k, v in metrics.items()))
+    if output:
+        results.save(output)
+
+
+@cli.command()
+@click.argument("old")
+@click.argument("new")
+@click.option("--threshold", default=0.1, show_default=True, help="Relative change reported as a regression.")
+def compare(old, new, threshold):
+    """
+    Compares two result files, and fails if any metric got worse by more than the threshold.
+    """
+
+    lines, regressions = results_module.compare(results_module.load(old), results_module.load(new), threshold)
+    for line in lines:
+        click.echo(line)
+    if regressions:
+        click.echo(f"{regressions} regression(s)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,160 @@
+"""
+Latency and throughput of the API hot paths, against a uvicorn server with a database seeded
+from a synthetic 17lands file.
+"""
+
+import concurrent.futures
+import contextlib
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Iterator
+
+import numpy
+import requests
+
+from benchmarks.imports import use_scryfall_stub
+from benchmarks.results import Results
+from benchmarks.scryfall_stub import ScryfallStub
+from benchmarks.synthetic import write_draft_file
+from eightpack.magic import ImportJob, do_imports, get_format
+
+SERVER_START_TIMEOUT = 30
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def run_server(db_url: str, env: dict[str, str]) -> Iterator[str]:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "eightpack.app:app", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, **env, "DB_URL": db_url},
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            try:
+                requests.get(f"{url}/drafts", timeout=1)
+                break
+            except requests.ConnectionError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("The API server didn't start!") from None
+                time.sleep(0.1)
+        yield url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+class Client:
+    """
+    One requests session per thread, so that connections are reused like a browser would.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        response = self.session.get(self.url + path, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        response = self.session.post(self.url + path, **kwargs)
+        response.raise_for_status()
+        return response
+
+
+def measure(results: Results, name: str, fn: Callable[[int], object], count: int, concurrency: int):
+    def timed(i: int) -> float:
+        start = time.perf_counter()
+        fn(i)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+        latencies = numpy.array(list(pool.map(timed, range(count)))) * 1000
+    seconds = time.perf_counter() - start
+    results.add(
+        name,
+        p50_ms=float(numpy.percentile(latencies, 50)),
+        p95_ms=float(numpy.percentile(latencies, 95)),
+        p99_ms=float(numpy.percentile(latencies, 99)),
+        requests_per_second=count / seconds,
+    )
+
+
+def run_api_benchmarks(
+    results: Results,
+    workdir: str,
+    *,
+    db_url: str | None,
+    drafts: int,
+    cards: int,
+    count: int,
+    concurrency: int,
+):
+    fmt = get_format("MKM")
+    file_name = os.path.join(workdir, "api-drafts.csv.gz")
+    write_draft_file(file_name, drafts, cards=cards, picks_per_pack=fmt.picks_per_pack, seed=1)
+    db_url = db_url or f"sqlite:///{os.path.join(workdir, 'api.sqlite')}"
+    with ScryfallStub(cards) as stub:
+        use_scryfall_stub(stub, os.path.join(workdir, "scryfall-cache"))
+        do_imports(db_url, [ImportJob(format=fmt, file_name=file_name)], reset=True, count=drafts)
+
+    # the password hashes of the setup aren't what's measured here
+    env = {"DEBUG": "1", "KDF_MAX_PENDING": str(max(64, concurrency * 2))}
+    with run_server(db_url, env) as url:
+        client = Client(url)
+        draft_ids = [d["id"] for d in client.get("/drafts", params={"page_size": 50}).json()["data"]]
+        choices = {d: client.get(f"/drafts/{d}/choices").json()["cards"] for d in draft_ids}
+        users = [{"login": f"bench{i}", "password": "benchmark"} for i in range(concurrency)]
+        tokens = [client.post("/users/register", json=user).json()["token"] for user in users]
+        rng = random.Random(0)
+
+        def save(i: int):
+            draft_id = draft_ids[i % len(draft_ids)]
+            picks = [rng.choice(turn)["id"] for turn in choices[draft_id]]
+            headers = {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+            client.post(f"/drafts/{draft_id}/save", json={"picks": picks}, headers=headers)
+
+        measure(results, "api.drafts", lambda i: client.get("/drafts"), count, concurrency)
+        measure(
+            results,
+            "api.drafts_cursor",
+            lambda i: client.get("/drafts", params={"cursor": draft_ids[i % len(draft_ids)]}),
+            count,
+            concurrency,
+        )
+        measure(
+            results,
+            "api.choices",
+            lambda i: client.get(f"/drafts/{draft_ids[i % len(draft_ids)]}/choices"),
+            count,
+            concurrency,
+        )
+        measure(results, "api.save", save, count, concurrency)
+        measure(
+            results,
+            "api.playthroughs",
+            lambda i: client.get(f"/drafts/{draft_ids[i % len(draft_ids)]}/playthroughs"),
+            count,
+            concurrency,
+        )
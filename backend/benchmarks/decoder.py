@@ -0,0 +1,117 @@
+"""
+Compares the pack decoding of DraftParser before and after RowDecoder: the time per row, and the memory
+(bytes and allocated blocks) that every decoded row takes.
+Usage: python -m benchmarks.decoder [--rows N] [--cards N]
+"""
+
+import csv
+import io
+import random
+import time
+import tracemalloc
+
+import click
+
+from eightpack.scan import DraftRow, RowDecoder
+
+
+def make_csv(rows: int, cards: int) -> list[str]:
+    rng = random.Random(0)
+    names = [f"Card {i}" for i in range(cards)]
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(
+        ["expansion", "event_type", "draft_id", "pack_number", "pick_number", "pick"]
+        + [f"pack_card_{n}" for n in names]
+        + [f"pool_{n}" for n in names]
+    )
+    for i in range(rows):
+        counts = [0] * cards
+        for c in rng.sample(range(cards), 14 - i % 14):
+            counts[c] += 1
+        writer.writerow(["MKM", "PremierDraft", f"d{i // 42}", 0, i % 14, names[0]] + counts + [0] * cards)
+    return out.getvalue().splitlines()
+
+
+def legacy_rows(lines: list[str]) -> list[dict[str, str]]:
+    # what DraftParser kept for every row of a draft before: the whole DictReader row
+    return list(csv.DictReader(lines))
+
+
+def legacy_decode(lines: list[str]) -> int:
+    # what DraftParser did before: DictReader + walking every column name of every row
+    total = 0
+    for row in csv.DictReader(lines):
+        cards = []
+        for k, v in row.items():
+            if k.startswith("pack_card_"):
+                for _ in range(int(v)):
+                    cards.append(k[10:])
+        total += len(cards)
+    return total
+
+
+def decoder_rows(lines: list[str]) -> list[DraftRow]:
+    reader = csv.reader(lines)
+    decoder = RowDecoder(next(reader))
+    return [decoder.decode(row) for row in reader]
+
+
+def decoder_decode(lines: list[str]) -> int:
+    reader = csv.reader(lines)
+    decoder = RowDecoder(next(reader))
+    return sum(int(decoder.decode(row).pack.sum()) for row in reader)
+
+
+def measure_time(fn, lines: list[str]) -> tuple[float, int]:
+    start = time.perf_counter()
+    result = fn(lines)
+    return time.perf_counter() - start, result
+
+
+def measure_memory(decode_rows, lines: list[str]) -> tuple[float, float, float]:
+    """
+    Returns the bytes and the memory blocks (allocations still alive) of one decoded row as it's kept
+    while its draft is put together (or sent back by a sampling worker), and the peak memory use per row.
+    """
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    rows = decode_rows(lines)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # the snapshots themselves are allocated by tracemalloc and not traced
+    stats = after.compare_to(before, "filename")
+    size = sum(s.size_diff for s in stats)
+    blocks = sum(s.count_diff for s in stats)
+    return size / len(rows), blocks / len(rows), peak / len(rows)
+
+
+@click.command()
+@click.option("--rows", default=20000, show_default=True)
+@click.option("--cards", default=300, show_default=True, help="Amount of pack_card_* columns.")
+@click.option("--memory-rows", default=2000, show_default=True, help="Rows decoded for the memory use.")
+def main(rows, cards, memory_rows):
+    lines = make_csv(rows, cards)
+    results = {}
+    for name, fn, decode_rows in [
+        ("legacy", legacy_decode, legacy_rows),
+        ("decoder", decoder_decode, decoder_rows),
+    ]:
+        elapsed, checksum = measure_time(fn, lines)
+        size, blocks, peak = measure_memory(decode_rows, lines[: memory_rows + 1])
+        results[name] = elapsed, size, blocks
+        click.echo(
+            f"{name:>8}: {elapsed / rows * 1e6:8.2f} us/row, {size:9.0f} bytes/row in {blocks:6.1f} blocks, "
+            f"peak {peak:9.0f} bytes/row, {checksum} cards"
+        )
+    (legacy_time, legacy_size, _), (decoder_time, decoder_size, _) = results["legacy"], results["decoder"]
+    click.echo(
+        f"speedup: {legacy_time / decoder_time:.2f}x, {legacy_size / decoder_size:.1f}x less memory per row"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Import throughput: parsing synthetic 17lands files with DraftParser.parse_gzip in every mode,
+and a whole do_imports into a database.
+"""
+
+import os
+import time
+
+from benchmarks.results import Results
+from benchmarks.scryfall_stub import ScryfallStub
+from benchmarks.synthetic import write_draft_file
+from eightpack import model
+from eightpack.config import app_config
+from eightpack.magic import DraftParser, ImportJob, do_imports, fetch_cards, get_format
+from eightpack.scryfall import ScryfallClient
+
+
+def use_scryfall_stub(stub: ScryfallStub, cache_dir: str):
+    # the import creates its own clients from the config
+    app_config.SCRYFALL_URL = stub.url
+    app_config.SCRYFALL_CACHE_DIR = cache_dir
+    app_config.SCRYFALL_REQUEST_INTERVAL = 0
+
+
+def best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run_import_benchmarks(
+    results: Results,
+    workdir: str,
+    *,
+    drafts: int,
+    cards: int,
+    count: int,
+    workers: int | None,
+    repeat: int,
+):
+    fmt = get_format("MKM")
+    file_name = os.path.join(workdir, "drafts.csv.gz")
+    rows = write_draft_file(file_name, drafts, cards=cards, picks_per_pack=fmt.picks_per_pack)
+    user = model.Player(login="$benchmark", name="benchmark", password="", virtual=True)
+
+    with ScryfallStub(cards) as stub:
+        use_scryfall_stub(stub, os.path.join(workdir, "scryfall-cache"))
+        client = ScryfallClient(stub.url, interval=0)
+        set_cards = fetch_cards("mkm", client)
+
+        def parse(**options):
+            DraftParser.parse_gzip(fmt, file_name, user, set_cards, client, count=count, **options)
+
+        seconds = best_of(repeat, lambda: parse(sample=False))
+        results.add("parse.head", seconds=seconds, drafts_per_second=count / seconds)
+
+        for name, options in [
+            ("parse.sample", {"sample": True}),
+            ("parse.sample_stats", {"sample": True, "collect_stats": True}),
+        ]:
+            seconds = best_of(repeat, lambda: parse(workers=workers, seed=b"benchmark", **options))
+            results.add(name, seconds=seconds, rows_per_second=rows / seconds)
+
+        db_url = f"sqlite:///{os.path.join(workdir, 'import.sqlite')}"
+        job = ImportJob(format=fmt, file_name=file_name)
+        stats = []
+
+        def import_all():
+            stats.append(
+                do_imports(
+                    db_url, [job], reset=True, count=count, sample=True, collect_stats=True, workers=workers
+                )
+            )
+
+        seconds = best_of(repeat, import_all)
+        loaded = min(stats, key=lambda s: s.seconds)
+        results.add(
+            "import.sqlite",
+            seconds=seconds,
+            rows_per_second=rows / seconds,
+            load_seconds=loaded.seconds,
+            loaded_rows_per_second=loaded.rows_per_second,
+        )
@@ -0,0 +1,75 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+
+# metrics named like this are better when higher, all the others (durations) when lower
+HIGHER_IS_BETTER = ("_per_second",)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Results:
+    """
+    Benchmark results of one run, as {benchmark: {metric: value}}, saved together with enough
+    information about the environment to tell whether two runs are comparable.
+    """
+
+    def __init__(self, parameters: dict | None = None):
+        self.parameters = parameters or {}
+        self.benchmarks: dict[str, dict[str, float]] = {}
+
+    def add(self, name: str, **metrics: float):
+        self.benchmarks[name] = {k: round(v, 4) for k, v in metrics.items()}
+
+    def to_dict(self) -> dict:
+        return {
+            "commit": git_commit(),
+            "created_at": datetime.datetime.now(datetime.UTC).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+            "parameters": self.parameters,
+            "benchmarks": self.benchmarks,
+        }
+
+    def save(self, file_name: str):
+        with open(file_name, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def load(file_name: str) -> dict:
+    with open(file_name) as f:
+        return json.load(f)
+
+
+def compare(old: dict, new: dict, threshold: float) -> tuple[list[str], int]:
+    """
+    Returns a report of the changes of every metric present in both runs,
+    and the amount of metrics that got worse by more than `threshold` (a fraction).
+    """
+
+    lines, regressions = [], 0
+    if old.get("parameters") != new.get("parameters") or old.get("machine") != new.get("machine"):
+        lines.append("warning: the runs used different parameters or machines")
+
+    for name, metrics in new["benchmarks"].items():
+        for metric, value in metrics.items():
+            previous = old["benchmarks"].get(name, {}).get(metric)
+            if previous is None:
+                continue
+            change = (value - previous) / previous if previous else 0.0
+            worse = -change if metric.endswith(HIGHER_IS_BETTER) else change
+            flag = ""
+            if worse > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            lines.append(f"{name:<28} {metric:<20} {previous:>12.3f} -> {value:>12.3f} ({change:+.1%}){flag}")
+    return lines, regressions
@@ -0,0 +1,119 @@
+"""
+Local stand-in for the parts of the Scryfall API used by the import, serving the cards
+of benchmarks.synthetic files, and for the image host (so it can be used as IMAGE_UPSTREAM).
+Usage: python -m benchmarks.scryfall_stub [--port 8766] [--cards N]
+"""
+
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import click
+from PIL import Image
+
+from benchmarks.synthetic import card_names
+
+# the page size of the real /cards/search
+PAGE_SIZE = 175
+# the size of Scryfall's `normal` images
+IMAGE_SIZE = (488, 680)
+
+
+def make_card(name: str, set_code: str) -> dict:
+    slug = name.lower().replace(" ", "-")
+    return {
+        "name": name,
+        "image_uris": {
+            "normal": f"https://cards.example/{set_code}/{slug}.jpg",
+            "art_crop": f"https://cards.example/{set_code}/{slug}-art.jpg",
+        },
+        "rarity": "common",
+        "set": set_code,
+        "layout": "normal",
+    }
+
+
+class ScryfallStub:
+    """
+    Serves `set:` searches with the synthetic cards of any set, /cards/collection lookups
+    (only used for The List) with nothing, and any .jpg path with the same image.
+    Runs in a background thread while used as a context manager.
+    """
+
+    def __init__(self, cards: int, host: str = "127.0.0.1", port: int = 0):
+        self.cards = cards
+        self.requests = 0
+        buffer = io.BytesIO()
+        Image.new("RGB", IMAGE_SIZE, (90, 60, 120)).save(buffer, "JPEG")
+        self.image = buffer.getvalue()
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *_args):
+                pass
+
+            def send_body(self, body: bytes, content_type: str):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_json(self, data: dict):
+                self.send_body(json.dumps(data).encode("utf-8"), "application/json")
+
+            def do_GET(self):
+                stub.requests += 1
+                if urlparse(self.path).path.endswith(".jpg"):
+                    self.send_body(stub.image, "image/jpeg")
+                    return
+                query = parse_qs(urlparse(self.path).query)
+                set_code = query.get("q", ["set:mkm"])[0].removeprefix("set:")
+                page = int(query.get("page", ["1"])[0])
+                names = card_names(stub.cards)
+                cards = [make_card(n, set_code) for n in names[(page - 1) * PAGE_SIZE : page * PAGE_SIZE]]
+                self.send_json(
+                    {"data": cards, "has_more": page * PAGE_SIZE < len(names), "total_cards": len(names)}
+                )
+
+            def do_POST(self):
+                stub.requests += 1
+                self.rfile.read(int(self.headers["Content-Length"]))
+                self.send_json({"data": [], "not_found": []})
+
+        return Handler
+
+    def __enter__(self) -> "ScryfallStub":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@click.command()
+@click.option("--port", default=8766, show_default=True)
+@click.option("--cards", default=250, show_default=True)
+def main(port, cards):
+    with ScryfallStub(cards, port=port) as stub:
+        click.echo(f"Serving {cards} cards per set at {stub.url}, Ctrl+C to stop")
+        try:
+            stub.thread.join()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Writes synthetic 17lands draft files, with the same columns as the public exports.
+Usage: python -m benchmarks.synthetic OUTPUT.csv.gz [--drafts N] [--cards N] [--set MKM] [--picks 13]
+"""
+
+import csv
+import gzip
+import random
+
+import click
+
+HEADER_START = [
+    "expansion",
+    "event_type",
+    "draft_id",
+    "draft_time",
+    "rank",
+    "event_match_wins",
+    "event_match_losses",
+    "pack_number",
+    "pick_number",
+    "pick",
+]
+HEADER_END = ["pick_maindeck_rate", "pick_sideboard_in_rate"]
+
+
+def card_names(cards: int) -> list[str]:
+    return [f"Card {i}" for i in range(cards)]
+
+
+def write_draft_file(
+    file_name: str,
+    drafts: int,
+    *,
+    cards: int = 250,
+    set_code: str = "MKM",
+    picks_per_pack: int = 13,
+    seed: int = 0,
+) -> int:
+    """
+    Writes `drafts` complete drafts of 3 packs with random contents and picks. The first pack has
+    one card more than there are picks, like in the real files. Returns the amount of rows.
+    """
+
+    rng = random.Random(seed)
+    names = card_names(cards)
+    rows = 0
+    with gzip.open(file_name, "wt", newline="", compresslevel=1) as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            HEADER_START + [f"pack_card_{n}" for n in names] + HEADER_END + [f"pool_{n}" for n in names]
+        )
+        pool_columns = [0] * cards
+        for d in range(drafts):
+            draft_id = f"{seed:04x}{d:012x}"
+            for pack_number in range(3):
+                for pick_number in range(picks_per_pack):
+                    pack = rng.sample(range(cards), picks_per_pack + 1 - pick_number)
+                    counts = [0] * cards
+                    for c in pack:
+                        counts[c] = 1
+                    writer.writerow(
+                        [set_code, "PremierDraft", draft_id, "2024-02-06 17:00:00", "gold", 3, 3]
+                        + [pack_number, pick_number, names[pack[0]]]
+                        + counts
+                        + [1.0, 0.0]
+                        + pool_columns
+                    )
+                    rows += 1
+    return rows
+
+
+@click.command()
+@click.argument("output")
+@click.option("--drafts", default=1000, show_default=True)
+@click.option("--cards", default=250, show_default=True, help="Amount of different cards in the set.")
+@click.option("--set", "set_code", default="MKM", show_default=True)
+@click.option("--picks", default=13, show_default=True, help="Picks per pack.")
+@click.option("--seed", default=0, show_default=True)
+def main(output, drafts, cards, set_code, picks, seed):
+    rows = write_draft_file(output, drafts, cards=cards, set_code=set_code, picks_per_pack=picks, seed=seed)
+    click.echo(f"Wrote {rows} rows to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import collections
+from typing import Iterable
+
+from sqlalchemy import Connection, delete, func, insert, select
+
+from eightpack import bulk, model
+
+
+def count_picks(runs: Iterable[tuple[int, Iterable[int]]]) -> collections.Counter[tuple[int, int, int]]:
+    """
+    Counts how often each card was picked on each turn, for (draft ID, picked card IDs) pairs.
+    """
+
+    counts = collections.Counter()
+    for draft_id, picks in runs:
+        for turn, card_id in enumerate(picks):
+            counts[draft_id, turn, card_id] += 1
+    return counts
+
+
+def add_pick_counts(conn: Connection, runs: Iterable[tuple[int, Iterable[int]]]):
+    counts = count_picks(runs)
+    bulk.increment_rows(
+        conn,
+        model.DraftPickCount.__table__,
+        ["draft_id", "turn_number", "card_id"],
+        "count",
+        [(*key, count) for key, count in counts.items()],
+    )
+
+
+def rebuild_pick_counts(conn: Connection) -> int:
+    """
+    Recomputes the whole draft_pick_counts table from the saved picks. Returns the amount of rows.
+    """
+
+    table = model.DraftPickCount.__table__
+    conn.execute(delete(table))
+    counts = (
+        select(
+            model.DraftRun.draft_id,
+            model.DraftPick.turn_number,
+            model.DraftPick.picked_card_id,
+            func.count(),
+        )
+        .join(model.DraftRun, model.DraftPick.draft_run_id == model.DraftRun.id)
+        .group_by(model.DraftRun.draft_id, model.DraftPick.turn_number, model.DraftPick.picked_card_id)
+    )
+    conn.execute(insert(table).from_select(["draft_id", "turn_number", "card_id", "count"], counts))
+    return conn.execute(select(func.count()).select_from(table)).scalar()
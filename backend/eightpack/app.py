@@ -2,27 +2,62 @@ import contextlib
 import re
 from http import HTTPStatus
 
+import requests
 import uvicorn
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy import select, func
+from fastapi import FastAPI, HTTPException, Depends, Query
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy import func, select
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session, contains_eager
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
 
 from eightpack import model
-from eightpack import data
+from eightpack import data, export, metrics, querycount
+from eightpack.caching import CachedBody, LRUCache, cached_response, etag_matches, make_etag
 from eightpack.config import app_config
-from eightpack.core import EngineGlobal, default_get_user, database
-from eightpack.util import encrypt_password, validate_password
+from eightpack.core import EngineGlobal, async_database, default_get_user, stream_partitions
+from eightpack.images import ImageCache
+from eightpack.kdf import KDFBusyError, KDFExecutor
+from eightpack.snapshot import ReadModel
+from eightpack.writer import Playthrough, PlaythroughWriter
 
 LOGIN_CHARACTERS = re.compile(r"[A-Za-z0-9_.-]")
+# Draft options only change with an import, so their serialized responses are kept until the next one
+choices_cache: LRUCache[tuple[str | None, int, data.ResponseFormat, bool], CachedBody] = LRUCache(
+    app_config.CHOICES_CACHE_SIZE
+)
+CHOICES_CACHE_CONTROL = f"public, max-age={app_config.CHOICES_MAX_AGE}"
+# keyed by import generation and set code, None is the catalog of all sets
+catalog_cache: LRUCache[tuple[str | None, str | None], CachedBody] = LRUCache(64)
+CARDS_CACHE_CONTROL = f"public, max-age={app_config.CARDS_MAX_AGE}"
+image_cache = ImageCache.from_config()
+# the cached files never change, but the card an ID refers to can, so the ETag (the file hash) is checked
+IMAGES_CACHE_CONTROL = f"public, max-age={app_config.IMAGE_MAX_AGE}"
+kdf = KDFExecutor(app_config.KDF_WORKERS, app_config.KDF_MAX_PENDING)
+playthrough_writer = PlaythroughWriter(app_config.SAVE_BATCH_WINDOW, app_config.SAVE_BATCH_SIZE)
+read_model = ReadModel(app_config.READ_MODEL_CHECK_INTERVAL, app_config.READ_MODEL_FILE)
+read_model.on_reload(choices_cache.clear)
+read_model.on_reload(catalog_cache.clear)
+metrics.register_collectors(kdf)
 
 
 @contextlib.asynccontextmanager
 async def lifespan(_app: FastAPI):
-    EngineGlobal.setup(app_config.DB_URL)
+    EngineGlobal.setup(app_config.DB_URL, use_async=app_config.DB_ASYNC, **app_config.pool_options())
+    metrics.instrument_engine(EngineGlobal.engine)
+    kdf.start()
+    playthrough_writer.start()
+    # the import generation is followed without the read model too, to know when the caches are stale
+    await read_model.start(use_snapshot=app_config.READ_MODEL)
     yield
-    EngineGlobal.destroy()
+    await read_model.stop()
+    await playthrough_writer.stop()
+    kdf.shutdown()
+    await EngineGlobal.destroy_async()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -35,6 +70,8 @@ origins = [
     "https://8pack.dreadrise.xyz",
 ]
 
+app.add_middleware(querycount.QueryCountMiddleware)  # type: ignore
+app.add_middleware(metrics.MetricsMiddleware)  # type: ignore
 app.add_middleware(
     CORSMiddleware,  # type: ignore
     allow_origins=origins,
@@ -44,8 +81,17 @@ app.add_middleware(
 )
 
 
+@app.exception_handler(KDFBusyError)
+async def kdf_busy_handler(_request: Request, _exc: KDFBusyError):
+    return JSONResponse(
+        {"detail": "The server is busy, please try again in a few seconds!"},
+        status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.post("/users/register")
-def register(req: data.RegisterRequest, db: Session = Depends(database)):
+async def register(req: data.RegisterRequest, db: AsyncSession = Depends(async_database)):
     if len(req.login) < 3:
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="This username is too short!")
     if not LOGIN_CHARACTERS.match(req.login):
@@ -53,10 +99,11 @@ def register(req: data.RegisterRequest, db: Session = Depends(database)):
             status_code=HTTPStatus.BAD_REQUEST, detail="This username contains invalid characters!"
         )
 
-    user = model.Player(login=req.login, name=req.login, password=encrypt_password(req.password))
+    password = await kdf.encrypt_password(req.password)
+    user = model.Player(login=req.login, name=req.login, password=password)
     db.add(user)
     try:
-        db.commit()
+        await db.commit()
     except IntegrityError as e:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST, detail="This username is already used!"
@@ -65,79 +112,257 @@ def register(req: data.RegisterRequest, db: Session = Depends(database)):
 
 
 @app.post("/users/login")
-def login(req: data.LoginRequest, db: Session = Depends(database)):
+async def login(req: data.LoginRequest, db: AsyncSession = Depends(async_database)):
     query = select(model.Player).where(model.Player.login == req.login)
-    result = db.execute(query)
+    result = await db.execute(query)
     if not (user := result.scalar()):
         raise HTTPException(status_code=HTTPStatus.FORBIDDEN, detail="User with this login was not found!")
     if user.virtual:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST, detail="Logging into this user is not allowed!"
         )
-    if not validate_password(req.password, user.password):
+    if not await kdf.validate_password(req.password, user.password):
         raise HTTPException(status_code=HTTPStatus.FORBIDDEN, detail="Incorrect password!")
     return data.UserTokenResponse.from_object(user)
 
 
 @app.post("/users/token")
-def get_token_info(user: model.Player = Depends(default_get_user)):
+async def get_token_info(user: model.Player = Depends(default_get_user)):
     return data.UserInformation.from_object(user)
 
 
 @app.get("/drafts")
-def get_drafts(pagination: data.PaginationRequest = Depends(), db: Session = Depends(database)):
+async def get_drafts(
+    pagination: data.PaginationRequest = Depends(), db: AsyncSession = Depends(async_database)
+):
+    page_size = pagination.get_page_size(default_page_size=12)
+    if read_model.snapshot is not None:
+        return read_model.snapshot.drafts_page(pagination, default_page_size=page_size)
+
     slice_query, count_query = pagination.convert(
         select(model.Draft)
         .join(model.Draft.front_card)
         .join(model.Draft.first_player)
-        .options(contains_eager(model.Draft.front_card))
-        .order_by(-model.Draft.id),
-        default_page_size=12,
+        .options(contains_eager(model.Draft.front_card), contains_eager(model.Draft.first_player))
+        .order_by(model.Draft.id.desc()),
+        default_page_size=page_size,
+        cursor_column=model.Draft.id,
+        count_query=select(model.Draft),
     )
-    slice_result, count = db.execute(slice_query), db.execute(count_query).scalar()
-    return data.PaginationResponse.from_result(slice_result, count, data.DraftResponse)
+    slice_result = await db.execute(slice_query)
+    count = await db.scalar(count_query) if count_query is not None else None
+    return data.PaginationResponse.from_result(slice_result, count, data.DraftResponse, page_size)
 
 
-@app.get("/drafts/{draft_id}/choices")
-def get_draft_choices(draft_id: int, db: Session = Depends(database)):
-    query = (
-        select(model.DraftOption)
-        .where(model.DraftOption.draft_id == draft_id)
-        .join(model.DraftOption.card)
-        .options(contains_eager(model.DraftOption.card))
-    )
-    result = db.execute(query)
-    return data.DraftChoicesResponse.from_list(result.scalars().all())
+@app.get("/cards", response_model=data.CardCatalogResponse)
+async def get_cards(
+    request: Request,
+    set_code: str | None = Query(None, alias="set"),
+    db: AsyncSession = Depends(async_database),
+):
+    set_code = set_code.lower() if set_code else None
+    # like the choices, the catalog only changes with an import (which can also reuse card IDs)
+    key = (read_model.generation, set_code)
+    etag = make_etag("cards", *key)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        headers = {"ETag": etag, "Cache-Control": CARDS_CACHE_CONTROL}
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+
+    if (cached := catalog_cache.get(key)) is None:
+        if read_model.snapshot is not None:
+            catalog = read_model.snapshot.card_catalog(set_code)
+        else:
+            query = select(model.Card).order_by(model.Card.id)
+            if set_code:
+                query = query.where(model.Card.set == set_code)
+            catalog = data.CardCatalogResponse.from_list((await db.execute(query)).scalars().all())
+        cached = CachedBody.from_model(catalog, etag if catalog.cards else None)
+        if catalog.cards:
+            catalog_cache.put(key, cached)
+    return cached_response(request, cached, CARDS_CACHE_CONTROL)
+
+
+@app.get("/cards/{card_id}/image")
+async def get_card_image(
+    card_id: int,
+    request: Request,
+    kind: data.ImageKind = data.ImageKind.normal,
+    width: int | None = None,
+    db: AsyncSession = Depends(async_database),
+):
+    if width is not None and width not in app_config.IMAGE_WIDTHS:
+        allowed = ", ".join(map(str, app_config.IMAGE_WIDTHS))
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=f"The width must be one of {allowed}!")
+
+    if read_model.snapshot is not None and card_id in read_model.snapshot.cards:
+        card = read_model.snapshot.cards[card_id]
+    elif (card := await db.scalar(select(model.Card).where(model.Card.id == card_id))) is None:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="This card doesn't exist!")
+    url = card.art_image if kind == data.ImageKind.art else card.image
+
+    try:
+        image = await run_in_threadpool(image_cache.get, url, width)
+    except requests.RequestException as e:
+        raise HTTPException(status_code=HTTPStatus.BAD_GATEWAY, detail="Couldn't load the image!") from e
+    headers = {"ETag": f'"{image.digest}"', "Cache-Control": IMAGES_CACHE_CONTROL}
+    if etag_matches(request.headers.get("If-None-Match"), headers["ETag"]):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return FileResponse(image.path, media_type=image.media_type, headers=headers)
+
+
+@app.get(
+    "/drafts/{draft_id}/choices",
+    response_model=data.DraftChoicesResponse | data.CompactDraftChoicesResponse,
+)
+async def get_draft_choices(
+    draft_id: int,
+    request: Request,
+    response_format: data.ResponseFormat = Query(data.ResponseFormat.full, alias="format"),
+    card_table: data.CardTable = Query(data.CardTable.inline, alias="cards"),
+    db: AsyncSession = Depends(async_database),
+):
+    # only the compact format can leave the cards out
+    with_cards = response_format == data.ResponseFormat.full or card_table == data.CardTable.inline
+    # the choices of a draft ID only change with an import, so the ETag is known without loading them
+    key = (read_model.generation, draft_id, response_format, with_cards)
+    etag = make_etag(*key[:2], response_format.value, with_cards)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        headers = {"ETag": etag, "Cache-Control": CHOICES_CACHE_CONTROL}
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+
+    # the session only connects to the database on the first query, so cache hits don't touch it
+    if (cached := choices_cache.get(key)) is None and read_model.snapshot is not None:
+        # drafts imported after the snapshot was loaded are looked up in the database until it's reloaded
+        if (choices := read_model.snapshot.choices(draft_id, response_format, with_cards)) is not None:
+            cached = CachedBody.from_model(choices, etag)
+            choices_cache.put(key, cached)
+    if cached is None:
+        query = select(model.DraftOption).where(model.DraftOption.draft_id == draft_id)
+        if with_cards:
+            query = query.join(model.DraftOption.card).options(contains_eager(model.DraftOption.card))
+        options = (await db.execute(query)).scalars().all()
+        # a draft without options probably doesn't exist (yet), so that response isn't tied to the import
+        if response_format == data.ResponseFormat.compact:
+            choices = data.CompactDraftChoicesResponse.from_list(options, with_cards=with_cards)
+        else:
+            choices = data.DraftChoicesResponse.from_list(options)
+        cached = CachedBody.from_model(choices, etag if options else None)
+        if options:
+            choices_cache.put(key, cached)
+    return cached_response(request, cached, CHOICES_CACHE_CONTROL)
 
 
 @app.post("/drafts/{draft_id}/save")
-def save_draft_playthrough(
+async def save_draft_playthrough(
     draft_id: int,
     choices: data.DraftPlaythroughRequest,
-    db: Session = Depends(database),
     user: model.Player = Depends(default_get_user),
 ):
-    picks = [model.DraftPick(turn_number=i, picked_card_id=card) for i, card in enumerate(choices.picks)]
-    run = model.DraftRun(player=user, draft_picks=picks, draft_id=draft_id)
-    db.add(run)
-    db.commit()
+    # returns after the playthrough has been committed, together with the others saved at the same time
+    await playthrough_writer.save(Playthrough(draft_id=draft_id, player_id=user.id, picks=choices.picks))
+    read_model.add_run(draft_id)
     return data.SuccessResponse()
 
 
-@app.get("/drafts/{draft_id}/playthroughs")
-def get_draft_playthroughs(draft_id: int, db: Session = Depends(database)):
-    query = (
+@app.get(
+    "/drafts/{draft_id}/playthroughs",
+    response_model=data.ManyDraftPlaythroughsResponse | data.CompactDraftPlaythroughsResponse,
+)
+async def get_draft_playthroughs(
+    draft_id: int,
+    pagination: data.PaginationRequest = Depends(),
+    response_format: data.ResponseFormat = Query(data.ResponseFormat.full, alias="format"),
+    card_table: data.CardTable = Query(data.CardTable.inline, alias="cards"),
+    db: AsyncSession = Depends(async_database),
+):
+    page_size = pagination.get_page_size(default_page_size=200, max_page_size=1000)
+    with_cards = response_format == data.ResponseFormat.full or card_table == data.CardTable.inline
+    # the runs with their players, then the picks of the whole page (with their cards) in a second query
+    picks = selectinload(model.DraftRun.draft_picks)
+    if with_cards:
+        picks = picks.joinedload(model.DraftPick.picked_card)
+    query, _ = pagination.convert(
         select(model.DraftRun)
         .where(model.DraftRun.draft_id == draft_id)
-        .join(model.DraftPick)
-        .join(model.Card)
-        .join(model.Player)
-        .order_by(model.DraftRun.id.desc())
-        .distinct()
+        .options(joinedload(model.DraftRun.player), picks)
+        .order_by(model.DraftRun.id.desc()),
+        default_page_size=page_size,
+        max_page_size=page_size,
+        cursor_column=model.DraftRun.id,
+    )
+
+    runs = (await db.execute(query)).scalars().all()
+    if response_format == data.ResponseFormat.compact:
+        return data.CompactDraftPlaythroughsResponse.from_list(runs, page_size, with_cards=with_cards)
+    return data.ManyDraftPlaythroughsResponse.from_list(runs, page_size)
+
+
+@app.get("/playthroughs/export")
+async def export_playthroughs(
+    filters: export.ExportFilter = Depends(),
+    export_format: data.ExportFormat = Query(data.ExportFormat.ndjson, alias="format"),
+    user: model.Player = Depends(default_get_user),
+):
+    # this can read the whole table, so only the players in EXPORT_LOGINS can use it (the CLI has no limits)
+    if user.login not in app_config.EXPORT_LOGINS:
+        raise HTTPException(status_code=HTTPStatus.FORBIDDEN, detail="You can't export the playthroughs!")
+
+    # streamed from a connection of its own, as the request's session is closed before the body is sent
+    encoder = export.make_encoder(export_format)
+    rows = stream_partitions(export.export_query(filters), export.YIELD_PER)
+    return StreamingResponse(
+        export.encode_batches_async(rows, encoder),
+        media_type=encoder.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{encoder.file_name}"'},
+    )
+
+
+@app.get("/drafts/{draft_id}/pick-distribution")
+async def get_pick_distribution(draft_id: int, db: AsyncSession = Depends(async_database)):
+    # the primary key starts with draft_id, so this is a single index range scan
+    query = select(model.DraftPickCount).where(model.DraftPickCount.draft_id == draft_id)
+    result = await db.execute(query)
+    return data.PickDistributionResponse.from_list(result.scalars().all())
+
+
+@app.get("/players/{player_id}/scores")
+async def get_player_scores(player_id: int, db: AsyncSession = Depends(async_database)):
+    query = select(
+        func.count(),
+        func.avg(model.DraftRun.original_agreement),
+        func.avg(model.DraftRun.majority_agreement),
+    ).where(model.DraftRun.player_id == player_id, model.DraftRun.is_original.is_(False))
+    run_count, original, majority = (await db.execute(query)).one()
+    return data.PlayerScoresResponse(
+        player_id=player_id,
+        run_count=run_count,
+        original_agreement=float(original) if original is not None else None,
+        majority_agreement=float(majority) if majority is not None else None,
     )
 
-    result = db.execute(query)
-    return data.ManyDraftPlaythroughsResponse.from_list(result.scalars().all())
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/metrics/kdf")
+async def get_kdf_metrics():
+    return kdf.metrics()
+
+
+@app.get("/formats/{set_code}/card-stats")
+async def get_card_stats(set_code: str, db: AsyncSession = Depends(async_database)):
+    set_code = set_code.upper()
+    query = (
+        select(model.CardStats)
+        .where(model.CardStats.set_code == set_code)
+        .join(model.CardStats.card)
+        .options(contains_eager(model.CardStats.card))
+        .order_by(model.CardStats.picked.desc())
+    )
+    result = await db.execute(query)
+    return data.ManyCardStatsResponse.from_list(set_code, result.scalars().all())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,106 @@
+import csv
+import io
+import itertools
+from typing import Iterable, Sequence
+
+from sqlalchemy import Connection, Table, and_, delete, false, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+BATCH_SIZE = 10000
+COPY_NULL = "\\N"
+
+
+def reserve_ids(conn: Connection, table: Table, count: int) -> list[int]:
+    """
+    Returns `count` IDs for new rows of the table, which rows inserted by other connections at the same time
+    (e.g. saved playthroughs) can't take. On Postgres they come from the table's sequence, so they aren't
+    necessarily consecutive. Elsewhere the database is locked for writes until the end of the transaction,
+    and the IDs follow the largest one in the table.
+    """
+
+    if count == 0:
+        return []
+    if conn.dialect.name == "postgresql":
+        sequence = func.pg_get_serial_sequence(table.name, "id")
+        query = select(func.nextval(sequence)).select_from(func.generate_series(1, count))
+        return sorted(conn.execute(query).scalars())
+
+    if conn.dialect.name == "sqlite":
+        # a write that changes nothing still takes the write lock, which BEGIN IMMEDIATE would take
+        conn.execute(delete(table).where(false()))
+    first = (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+    return list(range(first, first + count))
+
+
+def insert_rows(
+    conn: Connection,
+    table: Table,
+    columns: Sequence[str],
+    rows: Iterable[Sequence],
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """
+    Inserts plain tuples into a table in batches, bypassing the ORM. Uses COPY on psycopg2
+    and executemany (which SQLAlchemy turns into multi-row INSERTs) everywhere else.
+    Returns the amount of inserted rows.
+    """
+
+    use_copy = conn.dialect.driver == "psycopg2"
+    statement = insert(table)
+    total = 0
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, batch_size)):
+        if use_copy:
+            _copy_batch(conn, table, columns, batch)
+        else:
+            conn.execute(statement, [dict(zip(columns, row)) for row in batch])
+        total += len(batch)
+    return total
+
+
+def _copy_batch(conn: Connection, table: Table, columns: Sequence[str], batch: list[Sequence]):
+    buffer = io.StringIO()
+    # an unquoted empty field means NULL in Postgres CSV by default, which breaks empty strings
+    csv.writer(buffer).writerows([COPY_NULL if v is None else v for v in row] for row in batch)
+    buffer.seek(0)
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    query = f"COPY \"{table.name}\" ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+    # the DBAPI connection belongs to the current transaction, so this is rolled back together with it
+    with conn.connection.dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(query, buffer)
+
+
+def increment_rows(
+    conn: Connection, table: Table, key_columns: Sequence[str], column: str, rows: Iterable[Sequence]
+):
+    """
+    Adds the last value of each row to `column` of the row with the same key (the other values),
+    inserting the rows that don't exist yet. The key columns need a unique constraint.
+    """
+
+    dialects = {"postgresql": postgresql, "sqlite": sqlite}
+    if conn.dialect.name not in dialects:
+        _increment_each_row(conn, table, key_columns, column, sorted(rows))
+        return
+
+    statement = dialects[conn.dialect.name].insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c[c] for c in key_columns],
+        set_={column: table.c[column] + statement.excluded[column]},
+    )
+    # the same order in every transaction, so that concurrent upserts can't deadlock
+    params = [dict(zip([*key_columns, column], row)) for row in sorted(rows)]
+    if params:
+        conn.execute(statement, params)
+
+
+def _increment_each_row(
+    conn: Connection, table: Table, key_columns: Sequence[str], column: str, rows: Iterable[Sequence]
+):
+    # without upserts, every row is an UPDATE, followed by an INSERT if there was nothing to update
+    for row in rows:
+        *key, value = row
+        condition = and_(*(table.c[c] == v for c, v in zip(key_columns, key)))
+        result = conn.execute(update(table).where(condition).values({column: table.c[column] + value}))
+        if result.rowcount == 0:
+            conn.execute(insert(table).values(dict(zip([*key_columns, column], row))))
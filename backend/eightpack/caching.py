@@ -0,0 +1,112 @@
+import collections
+import dataclasses
+import hashlib
+import threading
+import time
+from http import HTTPStatus
+from typing import Generic, Hashable, TypeVar
+
+from pydantic import BaseModel
+from starlette.requests import Request
+from starlette.responses import Response
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Thread-safe dict that forgets the least recently used keys once it has more than `max_size` of them.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.items: collections.OrderedDict[K, V] = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: K) -> V | None:
+        with self.lock:
+            if key not in self.items:
+                return None
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key: K, value: V):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def pop(self, key: K) -> V | None:
+        with self.lock:
+            return self.items.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+class TTLCache(Generic[K, V]):
+    """
+    LRUCache whose entries also expire `ttl` seconds after they were stored.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.ttl = ttl
+        self.entries: LRUCache[K, tuple[float, V]] = LRUCache(max_size if ttl > 0 else 0)
+
+    def get(self, key: K) -> V | None:
+        if (entry := self.entries.get(key)) is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self.entries.pop(key)
+            return None
+        return value
+
+    def put(self, key: K, value: V):
+        self.entries.put(key, (time.monotonic() + self.ttl, value))
+
+    def pop(self, key: K):
+        self.entries.pop(key)
+
+    def clear(self):
+        self.entries.clear()
+
+
+@dataclasses.dataclass(frozen=True)
+class CachedBody:
+    body: bytes
+    etag: str
+
+    @classmethod
+    def from_model(cls, obj: BaseModel, etag: str | None = None) -> "CachedBody":
+        """
+        The ETag is the hash of the body, unless one is given.
+        """
+
+        body = obj.model_dump_json().encode("utf-8")
+        return cls(body=body, etag=etag or f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+
+def make_etag(*parts) -> str:
+    # for responses that are identified by something cheaper to get than their body
+    return f'"{hashlib.sha256(":".join(map(str, parts)).encode("utf-8")).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def cached_response(request: Request, cached: CachedBody, cache_control: str) -> Response:
+    headers = {"ETag": cached.etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("If-None-Match"), cached.etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
@@ -1,24 +1,64 @@
+import weakref
+from datetime import UTC, datetime
 from http import HTTPStatus
+from typing import AsyncIterator, Callable, Iterator, Sequence, TypeVar
 
 from fastapi import Depends, HTTPException
-from sqlalchemy import Engine, create_engine, select, Select
+from sqlalchemy import URL, Engine, Result, Executable, Row, create_engine, event, make_url, select, Select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 from starlette.requests import Request
 
 from eightpack import model
+from eightpack.caching import TTLCache
+from eightpack.config import app_config
 from eightpack.util import read_token, SignedToken
 
+R = TypeVar("R")
+token_cache: TTLCache[str, SignedToken] = TTLCache(app_config.AUTH_CACHE_SIZE, app_config.AUTH_CACHE_TTL)
+
+
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def make_async_url(url: str | URL) -> URL:
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver is known for {backend}!")
+    if url.get_driver_name() == ASYNC_DRIVERS[backend]:
+        return url
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
 
 class EngineGlobal:
+    """
+    The database engine of the process. In async mode, sessions are AsyncSessions using an async driver,
+    and `engine` is the sync facade of the async engine (which is still fine for attaching events).
+    """
+
     engine: Engine | None = None
     DBConnection: sessionmaker[Session] | None = None
+    async_engine: AsyncEngine | None = None
+    AsyncDBConnection: async_sessionmaker[AsyncSession] | None = None
 
     @classmethod
-    def setup(cls, url: str, *, expire_on_commit: bool = False) -> None:
+    def setup(
+        cls, url: str, *, expire_on_commit: bool = False, use_async: bool = False, **engine_options
+    ) -> None:
         if cls.engine is not None:
             raise RuntimeError("Duplicate setup of EngineGlobal!")
 
-        cls.engine = create_engine(url)
+        if use_async:
+            cls.async_engine = create_async_engine(make_async_url(url), **engine_options)
+            cls.engine = cls.async_engine.sync_engine
+            cls.AsyncDBConnection = async_sessionmaker(
+                autoflush=False, bind=cls.async_engine, expire_on_commit=expire_on_commit
+            )
+            return
+
+        cls.engine = create_engine(url, **engine_options)
         cls.DBConnection = sessionmaker(
             autocommit=False, autoflush=False, bind=cls.engine, expire_on_commit=expire_on_commit
         )
@@ -27,10 +67,21 @@ class EngineGlobal:
     def destroy(cls) -> None:
         if cls.engine is None:
             raise RuntimeError("No EngineGlobal to destroy!")
+        if cls.async_engine is not None:
+            raise RuntimeError("The async engine has to be destroyed with destroy_async!")
 
         cls.engine.dispose()
         cls.engine = cls.DBConnection = None
 
+    @classmethod
+    async def destroy_async(cls) -> None:
+        if cls.async_engine is None:
+            cls.destroy()
+            return
+
+        await cls.async_engine.dispose()
+        cls.engine = cls.async_engine = cls.AsyncDBConnection = None
+
 
 def database(url: str | None = None):
     if url is not None:
@@ -46,11 +97,121 @@ def database(url: str | None = None):
         db.close()
 
 
+class ThreadedSession:
+    """
+    Gives a sync Session the interface of an AsyncSession by running every database call in the
+    thread pool, so that the async endpoints also work with the sync engine.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def add(self, instance: object):
+        self.session.add(instance)
+
+    def add_all(self, instances: list[object]):
+        self.session.add_all(instances)
+
+    async def execute(self, statement: Executable, *args, **kwargs) -> Result:
+        return await run_in_threadpool(self.session.execute, statement, *args, **kwargs)
+
+    async def scalar(self, statement: Executable, *args, **kwargs):
+        return await run_in_threadpool(self.session.scalar, statement, *args, **kwargs)
+
+    async def flush(self):
+        await run_in_threadpool(self.session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.session.rollback)
+
+    async def close(self):
+        await run_in_threadpool(self.session.close)
+
+
+async def async_database():
+    """
+    Same as `database`, for async endpoints. Yields an AsyncSession in async mode, and a ThreadedSession
+    otherwise. Lazy loading doesn't work with either, so everything has to be loaded eagerly.
+    """
+
+    if EngineGlobal.AsyncDBConnection is not None:
+        async with EngineGlobal.AsyncDBConnection() as db:
+            yield db
+        return
+
+    if EngineGlobal.DBConnection is None:
+        raise RuntimeError("EngineGlobal is not initialized!")
+
+    db = ThreadedSession(EngineGlobal.DBConnection())
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+async def run_in_transaction(fn: Callable[..., R], *args) -> R:
+    """
+    Calls `fn(connection, *args)` inside a transaction without blocking the event loop, in either engine mode.
+    """
+
+    if EngineGlobal.async_engine is not None:
+        async with EngineGlobal.async_engine.begin() as conn:
+            return await conn.run_sync(fn, *args)
+
+    if EngineGlobal.engine is None:
+        raise RuntimeError("EngineGlobal is not initialized!")
+
+    def run() -> R:
+        with EngineGlobal.engine.begin() as conn:
+            return fn(conn, *args)
+
+    return await run_in_threadpool(run)
+
+
+async def stream_partitions(query: Select, yield_per: int) -> AsyncIterator[Sequence[Row]]:
+    """
+    Yields the rows of `query` in lists of `yield_per`, read with a server-side cursor where the driver
+    has one, in either engine mode. Uses its own connection, so it can outlive the request's session.
+    """
+
+    query = query.execution_options(yield_per=yield_per)
+    if EngineGlobal.async_engine is not None:
+        async with EngineGlobal.async_engine.connect() as conn:
+            result = await conn.stream(query)
+            async for partition in result.partitions():
+                yield partition
+        return
+
+    if EngineGlobal.engine is None:
+        raise RuntimeError("EngineGlobal is not initialized!")
+
+    def read() -> Iterator[Sequence[Row]]:
+        with EngineGlobal.engine.connect() as conn:
+            yield from conn.execute(query).partitions()
+
+    async for partition in iterate_in_threadpool(read()):
+        yield partition
+
+
 def get_access_token(request: Request) -> SignedToken | None:
     scheme, _, auth = request.headers.get("Authorization", "").partition(" ")
     if scheme != "Bearer":
         return None
-    return read_token(auth)
+    return read_cached_token(auth)
+
+
+def read_cached_token(token: str) -> SignedToken | None:
+    if (signed := token_cache.get(token)) is None:
+        if (signed := read_token(token)) is None:
+            return None
+        token_cache.put(token, signed)
+    # the cache may outlive the token
+    if signed.expiry_date <= datetime.now(tz=UTC):
+        return None
+    return signed
 
 
 def requires_login(token: SignedToken | None = Depends(get_access_token)) -> SignedToken:
@@ -60,18 +221,54 @@ def requires_login(token: SignedToken | None = Depends(get_access_token)) -> Sig
 
 
 class GetUser:
+    """
+    Dependency returning the logged in player. Players are cached for a short time, the returned object
+    is detached and shared between requests, so it must not be modified or added to a session.
+    """
+
+    instances: "weakref.WeakSet[GetUser]" = weakref.WeakSet()
+
     def __init__(self, query: Select[tuple[model.Player]] | None = None):
         self.query = query if query is not None else select(model.Player)
+        self.cache: TTLCache[int, model.Player] = TTLCache(
+            app_config.AUTH_CACHE_SIZE, app_config.AUTH_CACHE_TTL
+        )
+        GetUser.instances.add(self)
 
-    def __call__(self, db: Session = Depends(database), token: SignedToken = Depends(requires_login)):
+    async def __call__(
+        self, db: AsyncSession = Depends(async_database), token: SignedToken = Depends(requires_login)
+    ):
         if token is None:
             raise HTTPException(status_code=HTTPStatus.UNAUTHORIZED, detail="Invalid access token!")
 
-        result = db.execute(self.query.where(model.Player.id == int(token.user_id)))
+        user_id = int(token.user_id)
+        if user := self.cache.get(user_id):
+            return user
+
+        result = await db.execute(self.query.where(model.Player.id == user_id))
         if user := result.scalar():
+            self.cache.put(user_id, user)
             return user
 
         raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="User not found!")
 
 
+def invalidate_player(player_id: int):
+    for getter in list(GetUser.instances):
+        getter.cache.pop(player_id)
+
+
+def clear_auth_caches():
+    token_cache.clear()
+    for getter in list(GetUser.instances):
+        getter.cache.clear()
+
+
+@event.listens_for(model.Player, "after_update")
+@event.listens_for(model.Player, "after_delete")
+def _on_player_changed(_mapper, _connection, target: model.Player):
+    # only catches changes made through the ORM in this process, the TTL takes care of the rest
+    invalidate_player(target.id)
+
+
 default_get_user = GetUser()
@@ -1,10 +1,11 @@
 import abc
+import enum
 from datetime import datetime, timedelta
-from typing import TypeVar, Generic, Any, Collection
+from typing import TypeVar, Generic, Any, Collection, Iterable
 
 from pydantic import BaseModel
 from slugify import slugify
-from sqlalchemy import Select, Result, func
+from sqlalchemy import ColumnElement, Select, Result, func
 
 from eightpack import model
 from eightpack.util import sign_token
@@ -20,6 +21,29 @@ class FromObjectModel(BaseModel, abc.ABC):
 T = TypeVar("T", bound=FromObjectModel)
 
 
+class ResponseFormat(str, enum.Enum):
+    full = "full"
+    # every card is sent once in a `cards` table, and only referenced by ID everywhere else
+    compact = "compact"
+
+
+class CardTable(str, enum.Enum):
+    inline = "inline"
+    # the compact `cards` table is left out (null), for clients that already have the /cards catalog
+    omit = "omit"
+
+
+class ImageKind(str, enum.Enum):
+    normal = "normal"
+    art = "art"
+
+
+class ExportFormat(str, enum.Enum):
+    ndjson = "ndjson"
+    # gzip-compressed
+    csv = "csv"
+
+
 class FormatData(BaseModel):
     name: str
     set_code: str
@@ -63,24 +87,60 @@ class LoginRequest(BaseModel):
 class PaginationRequest(BaseModel):
     page_num: int = 0
     page_size: int | None = None
+    # ID of the last object of the previous page, used instead of page_num if present
+    cursor: int | None = None
 
     def convert(
-        self, query: Select, *, default_page_size: int = 10, max_page_size: int = 50
-    ) -> tuple[Select, Select]:
-        page_size = min(max_page_size, self.page_size or default_page_size)
+        self,
+        query: Select,
+        *,
+        default_page_size: int = 10,
+        max_page_size: int = 50,
+        cursor_column: ColumnElement[int] | None = None,
+        count_query: Select | None = None,
+    ) -> tuple[Select, Select | None]:
+        """
+        Returns the query for the requested page and the query counting all objects. With a cursor,
+        the page starts right after the cursor (`query` must be sorted by `cursor_column`, descending),
+        which doesn't require skipping rows, and the objects are not counted at all.
+        `count_query` can be used to count the objects without the joins that are only needed for the page.
+        """
+
+        page_size = self.get_page_size(default_page_size, max_page_size)
+        if self.cursor is not None and cursor_column is not None:
+            return query.where(cursor_column < self.cursor).limit(page_size), None
+
         slice_q = query.slice(page_size * self.page_num, page_size * (self.page_num + 1))
-        count_q = query.order_by(None).with_only_columns(func.count())
+        count_q = (
+            (count_query if count_query is not None else query)
+            .order_by(None)
+            .with_only_columns(func.count(), maintain_column_froms=True)
+        )
         return slice_q, count_q
 
+    def get_page_size(self, default_page_size: int = 10, max_page_size: int = 50) -> int:
+        return min(max_page_size, self.page_size or default_page_size)
+
+
+def next_cursor_of(items: list, page_size: int | None) -> int | None:
+    # a page shorter than the page size is the last one
+    return items[-1].id if items and len(items) == page_size else None
+
 
 class PaginationResponse(BaseModel, Generic[T]):
-    total_objects: int
+    # not counted when a cursor is used
+    total_objects: int | None
     data: list[T]
+    # only present if there may be more objects after this page
+    next_cursor: int | None = None
 
     @classmethod
-    def from_result(cls, result: Result, count: int, t: type[T]) -> "PaginationResponse[T]":
+    def from_result(
+        cls, result: Result, count: int | None, t: type[T], page_size: int
+    ) -> "PaginationResponse[T]":
+        items = [t.from_object(o) for o in result.scalars().all()]
         return PaginationResponse(
-            total_objects=count, data=[t.from_object(o) for o in result.scalars().all()]
+            total_objects=count, data=items, next_cursor=next_cursor_of(items, page_size)
         )
 
 
@@ -141,12 +201,18 @@ class DraftResponse(FromObjectModel):
         )
 
 
+def make_card_table(cards: Iterable[model.Card]) -> dict[int, CardResponse]:
+    return {c.id: CardResponse.from_object(c) for c in cards}
+
+
 class DraftPlaythroughResponse(FromObjectModel):
     id: int
     player_id: int
     player_name: str
     created_at: datetime
     is_og: bool
+    original_agreement: int | None
+    majority_agreement: int | None
     cards: list[CardResponse]
 
     @classmethod
@@ -157,16 +223,66 @@ class DraftPlaythroughResponse(FromObjectModel):
             player_name=obj.player.name,
             created_at=obj.created_at,
             is_og=obj.is_original,
+            original_agreement=obj.original_agreement,
+            majority_agreement=obj.majority_agreement,
             cards=[CardResponse.from_object(p.picked_card) for p in obj.draft_picks],
         )
 
 
 class ManyDraftPlaythroughsResponse(BaseModel):
     playthroughs: list[DraftPlaythroughResponse]
+    # only present if there may be more playthroughs after this page
+    next_cursor: int | None = None
+
+    @classmethod
+    def from_list(cls, items: Collection[model.DraftRun], page_size: int | None = None):
+        playthroughs = [DraftPlaythroughResponse.from_object(obj) for obj in items]
+        return cls(playthroughs=playthroughs, next_cursor=next_cursor_of(playthroughs, page_size))
+
+
+class CompactDraftPlaythroughResponse(FromObjectModel):
+    id: int
+    player_id: int
+    player_name: str
+    created_at: datetime
+    is_og: bool
+    original_agreement: int | None
+    majority_agreement: int | None
+    picks: list[int]
+
+    @classmethod
+    def from_object(cls, obj: model.DraftRun):
+        return cls(
+            id=obj.id,
+            player_id=obj.player_id,
+            player_name=obj.player.name,
+            created_at=obj.created_at,
+            is_og=obj.is_original,
+            original_agreement=obj.original_agreement,
+            majority_agreement=obj.majority_agreement,
+            picks=[p.picked_card_id for p in obj.draft_picks],
+        )
+
+
+class CompactDraftPlaythroughsResponse(BaseModel):
+    cards: dict[int, CardResponse] | None
+    playthroughs: list[CompactDraftPlaythroughResponse]
+    next_cursor: int | None = None
 
     @classmethod
-    def from_list(cls, items: Collection[model.DraftRun]):
-        return cls(playthroughs=[DraftPlaythroughResponse.from_object(obj) for obj in items])
+    def from_list(
+        cls, items: Collection[model.DraftRun], page_size: int | None = None, *, with_cards: bool = True
+    ):
+        playthroughs = [CompactDraftPlaythroughResponse.from_object(obj) for obj in items]
+        return cls(
+            cards=(
+                make_card_table(p.picked_card for obj in items for p in obj.draft_picks)
+                if with_cards
+                else None
+            ),
+            playthroughs=playthroughs,
+            next_cursor=next_cursor_of(playthroughs, page_size),
+        )
 
 
 class DraftChoicesResponse(BaseModel):
@@ -178,3 +294,92 @@ class DraftChoicesResponse(BaseModel):
         for item in items:
             cards_per_turn[item.turn_number].append(CardResponse.from_object(item.card))
         return cls(cards=cards_per_turn)
+
+
+class CompactDraftChoicesResponse(BaseModel):
+    cards: dict[int, CardResponse] | None
+    # IDs of the cards in the pack of every turn
+    turns: list[list[int]]
+
+    @classmethod
+    def from_list(cls, items: Collection[model.DraftOption], *, with_cards: bool = True):
+        turns = [[] for _ in range(8)]
+        for item in items:
+            turns[item.turn_number].append(item.card_id)
+        return cls(cards=make_card_table(item.card for item in items) if with_cards else None, turns=turns)
+
+
+class CardCatalogResponse(BaseModel):
+    cards: dict[int, CardResponse]
+
+    @classmethod
+    def from_list(cls, items: Collection[model.Card]):
+        return cls(cards=make_card_table(items))
+
+
+class CardStatsResponse(FromObjectModel):
+    card: CardResponse
+    seen: int
+    picked: int
+    # how often the card was taken when it was in the pack
+    pick_rate: float
+    # average pick number when taken (ATA)
+    average_pick: float | None
+    # the same as pick_rate, but only in the first 8 picks of pack 1
+    early_pick_rate: float
+
+    @classmethod
+    def from_object(cls, obj: model.CardStats):
+        return cls(
+            card=CardResponse.from_object(obj.card),
+            seen=obj.seen,
+            picked=obj.picked,
+            pick_rate=obj.picked / obj.seen if obj.seen else 0.0,
+            average_pick=obj.pick_position_total / obj.picked if obj.picked else None,
+            early_pick_rate=obj.picked_early / obj.seen_early if obj.seen_early else 0.0,
+        )
+
+
+class ManyCardStatsResponse(BaseModel):
+    set_code: str
+    stats: list[CardStatsResponse]
+
+    @classmethod
+    def from_list(cls, set_code: str, items: Collection[model.CardStats]):
+        return cls(set_code=set_code, stats=[CardStatsResponse.from_object(obj) for obj in items])
+
+
+class PickDistributionResponse(BaseModel):
+    run_count: int
+    # for every turn, how many runs picked each card (by ID)
+    turns: list[dict[int, int]]
+
+    @classmethod
+    def from_list(cls, items: Collection[model.DraftPickCount]):
+        turns = [{} for _ in range(8)]
+        for item in items:
+            turns[item.turn_number][item.card_id] = item.count
+        return cls(run_count=sum(turns[0].values()), turns=turns)
+
+
+class PlayerScoresResponse(BaseModel):
+    player_id: int
+    run_count: int
+    # average amount of picks (out of 8) agreeing with the original player and with the majority
+    original_agreement: float | None
+    majority_agreement: float | None
+
+
+class KDFMetricsResponse(BaseModel):
+    workers: int
+    max_pending: int
+    in_progress: int
+    # hashes waiting for a free worker
+    queue_depth: int
+    completed: int
+    # calls refused with 503 because the queue was full
+    rejected: int
+    # in seconds, including the time spent in the queue, over the most recent calls
+    latency_p50: float | None
+    latency_p95: float | None
+    latency_max: float | None
@@ -0,0 +1,170 @@
+"""
+Bulk export of the saved runs with their picks, as NDJSON or gzip-compressed CSV. The rows are read with a
+server-side cursor and encoded a batch at a time, so the memory use doesn't depend on the amount of runs.
+"""
+
+import csv
+import dataclasses
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Sequence
+
+from sqlalchemy import Connection, Row, Select, select
+
+from eightpack import model
+from eightpack.data import ExportFormat
+from eightpack.scoring import TURNS
+
+YIELD_PER = 2000
+RUN_FIELDS = [
+    "id",
+    "draft_id",
+    "player_id",
+    "player_name",
+    "created_at",
+    "is_original",
+    "original_agreement",
+    "majority_agreement",
+]
+CSV_COLUMNS = RUN_FIELDS + [f"pick_{t + 1}" for t in range(TURNS)] + [f"card_{t + 1}" for t in range(TURNS)]
+
+
+@dataclasses.dataclass
+class ExportFilter:
+    draft_id: int | None = None
+    player_id: int | None = None
+    # runs created at or after `since` and before `until`
+    since: datetime | None = None
+    until: datetime | None = None
+
+
+def export_query(filters: ExportFilter) -> Select:
+    """
+    One row per pick, ordered so that the picks of a run are next to each other.
+    """
+
+    query = (
+        select(
+            model.DraftRun.id,
+            model.DraftRun.draft_id,
+            model.DraftRun.player_id,
+            model.Player.name,
+            model.DraftRun.created_at,
+            model.DraftRun.is_original,
+            model.DraftRun.original_agreement,
+            model.DraftRun.majority_agreement,
+            model.DraftPick.picked_card_id,
+            model.Card.name,
+        )
+        .join(model.Player, model.DraftRun.player_id == model.Player.id)
+        .join(model.DraftPick, model.DraftPick.draft_run_id == model.DraftRun.id)
+        .join(model.Card, model.DraftPick.picked_card_id == model.Card.id)
+        .order_by(model.DraftRun.id, model.DraftPick.turn_number)
+    )
+    if filters.draft_id is not None:
+        query = query.where(model.DraftRun.draft_id == filters.draft_id)
+    if filters.player_id is not None:
+        query = query.where(model.DraftRun.player_id == filters.player_id)
+    if filters.since is not None:
+        query = query.where(model.DraftRun.created_at >= filters.since)
+    if filters.until is not None:
+        query = query.where(model.DraftRun.created_at < filters.until)
+    return query
+
+
+class RunGrouper:
+    """
+    Turns batches of export_query rows into one record per run. The last run of a batch may continue
+    in the next one, so it's only returned once a different run starts (or by `finish`).
+    """
+
+    def __init__(self):
+        self.current: dict | None = None
+
+    def feed(self, rows: Iterable[Row]) -> list[dict]:
+        records = []
+        for row in rows:
+            if self.current is None or self.current["id"] != row[0]:
+                if self.current is not None:
+                    records.append(self.current)
+                self.current = dict(zip(RUN_FIELDS, row[: len(RUN_FIELDS)]), picks=[], cards=[])
+                self.current["created_at"] = self.current["created_at"].isoformat()
+            self.current["picks"].append(row[-2])
+            self.current["cards"].append(row[-1])
+        return records
+
+    def finish(self) -> list[dict]:
+        records = [self.current] if self.current is not None else []
+        self.current = None
+        return records
+
+
+class NDJSONEncoder:
+    media_type = "application/x-ndjson"
+    file_name = "playthroughs.ndjson"
+
+    def encode(self, records: Sequence[dict]) -> bytes:
+        return "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records).encode("utf-8")
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class GzipCSVEncoder:
+    media_type = "application/gzip"
+    file_name = "playthroughs.csv.gz"
+
+    def __init__(self):
+        # wbits=31 writes a gzip header and trailer around the deflate stream
+        self.compressor = zlib.compressobj(wbits=31)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.writer.writerow(CSV_COLUMNS)
+
+    def encode(self, records: Sequence[dict]) -> bytes:
+        for r in records:
+            padding = [None] * (TURNS - len(r["picks"]))
+            self.writer.writerow([r[f] for f in RUN_FIELDS] + r["picks"] + padding + r["cards"] + padding)
+        data = self.buffer.getvalue().encode("utf-8")
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return self.compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self.encode([]) + self.compressor.flush()
+
+
+def make_encoder(export_format: ExportFormat) -> NDJSONEncoder | GzipCSVEncoder:
+    return GzipCSVEncoder() if export_format == ExportFormat.csv else NDJSONEncoder()
+
+
+def encode_batches(
+    batches: Iterable[Sequence[Row]], encoder: NDJSONEncoder | GzipCSVEncoder
+) -> Iterator[bytes]:
+    grouper = RunGrouper()
+    for rows in batches:
+        if chunk := encoder.encode(grouper.feed(rows)):
+            yield chunk
+    yield encoder.encode(grouper.finish()) + encoder.finish()
+
+
+async def encode_batches_async(
+    batches: AsyncIterable[Sequence[Row]], encoder: NDJSONEncoder | GzipCSVEncoder
+) -> AsyncIterator[bytes]:
+    grouper = RunGrouper()
+    async for rows in batches:
+        if chunk := encoder.encode(grouper.feed(rows)):
+            yield chunk
+    yield encoder.encode(grouper.finish()) + encoder.finish()
+
+
+def export_runs(
+    conn: Connection,
+    filters: ExportFilter,
+    export_format: ExportFormat,
+    yield_per: int = YIELD_PER,
+) -> Iterator[bytes]:
+    query = export_query(filters).execution_options(yield_per=yield_per)
+    return encode_batches(conn.execute(query).partitions(), make_encoder(export_format))
@@ -0,0 +1,142 @@
+import concurrent.futures
+import dataclasses
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from typing import Iterable
+from urllib.parse import urlsplit
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from eightpack.config import app_config
+
+logger = logging.getLogger(__name__)
+THUMBNAIL_QUALITY = 85
+
+
+@dataclasses.dataclass
+class CachedImage:
+    path: str
+    # hash of the image contents (and the width of a thumbnail), usable as an ETag
+    digest: str
+    media_type: str
+
+
+def write_atomically(path: str, contents: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # requests for the same image can be served at the same time, by different processes
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(contents)
+    os.replace(temp_path, path)
+
+
+class ImageCache:
+    """
+    Content-addressed on-disk cache of the card images. `urls/` maps the hash of an image URL to the hash
+    of the downloaded file, which is stored once in `blobs/` however many URLs point to it, and resized
+    copies are stored in `thumbnails/{width}/`. Files are never changed once written.
+    """
+
+    def __init__(
+        self, directory: str, upstream: str | None = None, *, widths: Iterable[int] = (), workers: int = 4
+    ):
+        self.directory = directory
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.widths = set(widths)
+        self.workers = workers
+
+        retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_maxsize=workers, max_retries=retries)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": "8pack"})
+
+    @classmethod
+    def from_config(cls) -> "ImageCache":
+        return cls(
+            app_config.IMAGE_CACHE_DIR,
+            app_config.IMAGE_UPSTREAM,
+            widths=app_config.IMAGE_WIDTHS,
+            workers=app_config.SCRYFALL_WORKERS,
+        )
+
+    def _path(self, kind: str, digest: str) -> str:
+        return os.path.join(self.directory, kind, digest[:2], digest)
+
+    def upstream_url(self, url: str) -> str:
+        if self.upstream is None:
+            return url
+        parts = urlsplit(url)
+        return self.upstream + parts.path + (f"?{parts.query}" if parts.query else "")
+
+    def fetch(self, url: str) -> CachedImage:
+        """
+        Returns the image at the URL, downloading it unless it's already cached.
+        """
+
+        index_path = self._path("urls", hashlib.sha256(url.encode("utf-8")).hexdigest())
+        try:
+            with open(index_path) as f:
+                entry = json.load(f)
+            return CachedImage(self._path("blobs", entry["digest"]), entry["digest"], entry["media_type"])
+        except FileNotFoundError:
+            pass
+
+        response = self.session.get(self.upstream_url(url), timeout=30)
+        response.raise_for_status()
+        digest = hashlib.sha256(response.content).hexdigest()
+        media_type = response.headers.get("Content-Type", "image/jpeg")
+        blob_path = self._path("blobs", digest)
+        if not os.path.exists(blob_path):
+            write_atomically(blob_path, response.content)
+        write_atomically(index_path, json.dumps({"digest": digest, "media_type": media_type}).encode("utf-8"))
+        return CachedImage(blob_path, digest, media_type)
+
+    def thumbnail(self, image: CachedImage, width: int) -> CachedImage:
+        """
+        Returns the image scaled down to `width` (keeping the aspect ratio) as a JPEG, making it if needed.
+        """
+
+        path = os.path.join(self.directory, "thumbnails", str(width), image.digest[:2], image.digest)
+        thumbnail = CachedImage(path, f"{image.digest}-{width}", "image/jpeg")
+        if os.path.exists(path):
+            return thumbnail
+
+        with Image.open(image.path) as original:
+            original.thumbnail((width, original.height))
+            resized = original.convert("RGB")
+        buffer = io.BytesIO()
+        resized.save(buffer, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        write_atomically(path, buffer.getvalue())
+        return thumbnail
+
+    def get(self, url: str, width: int | None = None) -> CachedImage:
+        image = self.fetch(url)
+        return self.thumbnail(image, width) if width is not None else image
+
+    def prewarm(self, urls: Iterable[str]) -> int:
+        """
+        Downloads the images and makes their thumbnails in every configured width, in parallel.
+        Images that can't be downloaded are logged and skipped. Returns the amount of cached images.
+        """
+
+        def warm(url: str) -> bool:
+            try:
+                image = self.fetch(url)
+                for width in self.widths:
+                    self.thumbnail(image, width)
+                return True
+            except (requests.RequestException, OSError) as e:
+                logger.warning("Couldn't cache the image %s: %s", url, e)
+                return False
+
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            return sum(pool.map(warm, sorted(set(urls))))
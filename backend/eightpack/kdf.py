@@ -0,0 +1,84 @@
+import asyncio
+import collections
+import concurrent.futures
+import os
+import time
+from typing import Callable, TypeVar
+
+from eightpack import data
+from eightpack.util import encrypt_password, validate_password
+
+R = TypeVar("R")
+# amount of recent calls the latency percentiles are computed from
+LATENCY_SAMPLES = 1000
+
+
+class KDFBusyError(Exception):
+    pass
+
+
+class KDFExecutor:
+    """
+    Runs password hashing in its own process pool, so that it neither blocks the event loop nor takes
+    the threads used by the other endpoints. At most `max_pending` hashes can be running or waiting
+    at once, any call above that fails immediately with KDFBusyError.
+    Only meant to be used from the event loop thread, which is why the counters don't need a lock.
+    """
+
+    def __init__(self, workers: int | None, max_pending: int):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.pool: concurrent.futures.ProcessPoolExecutor | None = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.latencies: collections.deque[float] = collections.deque(maxlen=LATENCY_SAMPLES)
+
+    def start(self):
+        if self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    async def run(self, fn: Callable[..., R], *args) -> R:
+        if self.pool is None:
+            raise RuntimeError("KDFExecutor is not started!")
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise KDFBusyError()
+
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            self.latencies.append(time.perf_counter() - start)
+
+    async def encrypt_password(self, password: str) -> str:
+        return await self.run(encrypt_password, password)
+
+    async def validate_password(self, password: str, pass_hash: str) -> bool:
+        return await self.run(validate_password, password, pass_hash)
+
+    def metrics(self) -> data.KDFMetricsResponse:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float | None:
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+
+        return data.KDFMetricsResponse(
+            workers=self.workers,
+            max_pending=self.max_pending,
+            in_progress=min(self.pending, self.workers),
+            queue_depth=max(0, self.pending - self.workers),
+            completed=self.completed,
+            rejected=self.rejected,
+            latency_p50=percentile(0.5),
+            latency_p95=percentile(0.95),
+            latency_max=latencies[-1] if latencies else None,
+        )
@@ -1,31 +1,50 @@
+import concurrent.futures
+import contextlib
 import csv
 import dataclasses
 import gzip
+import io
 import itertools
+import json
 import os
-from typing import IO
-from urllib.parse import urlencode
+import time
+from typing import IO, Iterator
 
+import numpy
 import requests
+from sqlalchemy import Connection, delete, insert, select
 
+from eightpack.config import app_config
 from eightpack.core import EngineGlobal
-from eightpack.data import FormatData, ScryfallCard
-from eightpack import model
-from eightpack.util import paginate_scryfall_get, paginate_scryfall_post, remove_face2
+from eightpack.data import FormatData
+from eightpack.images import ImageCache
+from eightpack import aggregates, bulk, migrations, model, scan, scoring
+from eightpack.scryfall import ScryfallClient
+from eightpack.util import remove_face2
 
-# We're currently only supporting one format
-FORMAT = FormatData(name="Murders at Karlov Manor", set_code="MKM", picks_per_pack=13)
+# Known formats by set code, more can be added with FORMATS_FILE or `import-drafts --format`
+FORMATS = {
+    f.set_code: f
+    for f in [
+        FormatData(name="Murders at Karlov Manor", set_code="MKM", picks_per_pack=13),
+    ]
+}
+DEFAULT_FORMAT = "MKM"
 SPECIAL_SETS = ["spg", "plst"]
 # don't show these card layouts on front page because they have a stupid art crop
 BAD_LAYOUTS = ["split", "flip", "class", "case", "saga", "battle"]
 
-# draft filename aliases because they're long
+# draft filename aliases because they're long, {set_code} is replaced with the format's set
 DRAFT_FILENAMES = {
-    "local-premier": "../draft_data_public.MKM.PremierDraft.csv.gz",
-    "local-traditional": "../draft_data_public.MKM.TradDraft.csv.gz",
-    "17lands-premier": "https://17lands-public.s3.amazonaws.com/analysis_data/draft_data/draft_data_public.MKM.PremierDraft.csv.gz",
-    "17lands-traditional": "https://17lands-public.s3.amazonaws.com/analysis_data/draft_data/draft_data_public.MKM.TradDraft.csv.gz",
+    "local-premier": "../draft_data_public.{set_code}.PremierDraft.csv.gz",
+    "local-traditional": "../draft_data_public.{set_code}.TradDraft.csv.gz",
+    "17lands-premier": "https://17lands-public.s3.amazonaws.com/analysis_data/draft_data/draft_data_public.{set_code}.PremierDraft.csv.gz",
+    "17lands-traditional": "https://17lands-public.s3.amazonaws.com/analysis_data/draft_data/draft_data_public.{set_code}.TradDraft.csv.gz",
 }
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+DEFAULT_DRAFT_COUNT = 25
+# how many draft IDs are looked up in one query, SQLite limits the amount of parameters
+SOURCE_ID_CHUNK = 500
 
 
 @dataclasses.dataclass
@@ -34,39 +53,124 @@ class DraftParseResponse:
     skip_lines: int = 0
 
 
-def fetch_cards(expansion: str) -> list[model.Card]:
-    cards = []
-    set_query = urlencode({"q": f"set:{expansion}"})
-    for card in paginate_scryfall_get(ScryfallCard, f"/cards/search?{set_query}"):
-        cards.append(card.to_model())
-    return cards
+@dataclasses.dataclass
+class ParsedSet:
+    cards: list[model.Card] = dataclasses.field(default_factory=list)
+    drafts: list[model.Draft] = dataclasses.field(default_factory=list)
+    card_stats: list[model.CardStats] = dataclasses.field(default_factory=list)
+
+    def extend(self, other: "ParsedSet"):
+        self.cards += other.cards
+        self.drafts += other.drafts
+        self.card_stats += other.card_stats
+
+
+@dataclasses.dataclass
+class ImportJob:
+    format: FormatData
+    file_name: str
+
+
+@dataclasses.dataclass
+class ImportStats:
+    rows: int
+    seconds: float
+    # drafts of the files that were already in the database
+    skipped_drafts: int = 0
+    # card images put into the image cache
+    images: int = 0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def load_formats(file_name: str):
+    with open(file_name) as f:
+        for item in json.load(f):
+            register_format(FormatData(**item))
+
+
+def register_format(fmt: FormatData):
+    FORMATS[fmt.set_code.upper()] = fmt
+
+
+def get_format(set_code: str) -> FormatData:
+    try:
+        return FORMATS[set_code.upper()]
+    except KeyError:
+        raise ValueError(f"Unknown format: {set_code}, add it to FORMATS_FILE or use --format") from None
+
+
+def resolve_draft_file(file_name: str, fmt: FormatData) -> str:
+    if file_name in DRAFT_FILENAMES:
+        return DRAFT_FILENAMES[file_name].format(set_code=fmt.set_code)
+    return file_name
+
+
+def fetch_cards(expansion: str, client: ScryfallClient) -> list[model.Card]:
+    return [card.to_model() for card in client.set_cards(expansion)]
 
 
 # I don't know of a good way to fetch cards from THE LIST that belong to a given set
 # But actually, 17-lands gives us the list of such cards
-def fetch_the_list(names: list[str]) -> list[model.Card]:
-    assert len(names) <= 75, f"Didn't expect this many The List cards: {len(names)}"
-    cards = []
-    for card in itertools.chain.from_iterable(
-        [
-            paginate_scryfall_post(
-                ScryfallCard,
-                "/cards/collection",
-                {"identifiers": [{"name": remove_face2(n), "set": set_name} for n in names]},
-            )
-            for set_name in SPECIAL_SETS
-        ]
-    ):
-        cards.append(card.to_model())
-    return cards
+def fetch_the_list(names: list[str], client: ScryfallClient) -> list[model.Card]:
+    if not names:
+        return []
+    sets = client.map(lambda set_name: client.named_cards(set_name, names), SPECIAL_SETS)
+    return [card.to_model() for card in itertools.chain.from_iterable(sets)]
+
+
+def is_remote_file(file_name: str) -> bool:
+    return file_name.startswith("http://") or file_name.startswith("https://")
+
+
+@contextlib.contextmanager
+def open_draft_file(file_name: str, *, stream: bool = True) -> Iterator[IO[bytes]]:
+    """
+    Opens a gzipped 17lands file (local path or URL) as a decompressed binary stream.
+    With `stream`, remote files are decompressed while they are being downloaded, so only
+    the part of the file that is actually read gets transferred, and memory use stays bounded.
+    Otherwise, the file is downloaded to the working directory first and deleted afterwards.
+    """
+
+    if not is_remote_file(file_name):
+        with gzip.open(file_name, "rb") as f:
+            yield f
+        return
+
+    with requests.get(file_name, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        # only undoes the transfer encoding (if any), the file itself is still gzipped
+        response.raw.decode_content = True
+        if stream:
+            with gzip.GzipFile(fileobj=response.raw, mode="rb") as f:
+                yield f
+            return
+
+        local_name = file_name.rsplit("/", 1)[1]
+        with open(local_name, "wb") as f:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+
+    try:
+        with gzip.open(local_name, "rb") as f:
+            yield f
+    finally:
+        os.remove(local_name)
 
 
 class DraftParser:
-    def __init__(self, fmt: FormatData, player: model.Player, cards: list[model.Card]):
+    def __init__(
+        self, fmt: FormatData, player: model.Player, cards: list[model.Card], client: ScryfallClient
+    ):
         self.format = fmt
         self.player = player
+        self.client = client
         self.thelist_cards: list[model.Card] = []
         self.cards: dict[str, model.Card] = {}
+        # card of every pack_card_* column, filled once the header is known
+        self.column_cards: list[model.Card | None] = []
         self.add_cards(cards)
 
     def add_cards(self, cards: list[model.Card]):
@@ -74,40 +178,61 @@ class DraftParser:
             self.cards[c.name] = c
             self.cards[remove_face2(c.name)] = c
 
+    def load_columns(self, decoder: scan.RowDecoder):
+        if self.column_cards:
+            return
+        # the list, lmao.
+        thelist_card_names = [c for c in decoder.card_names if c not in self.cards]
+        self.thelist_cards = fetch_the_list(thelist_card_names, self.client)
+        self.add_cards(self.thelist_cards)
+        self.column_cards = [self.cards.get(c) for c in decoder.card_names]
+
     @classmethod
-    def parse_gzip(cls, file_name: str, user: model.Player, cards: list[model.Card]):
-        c = cls(FORMAT, user, cards)
-        file_name = DRAFT_FILENAMES.get(file_name, file_name)
-        should_delete_file = False
-        if file_name.startswith("http://") or file_name.startswith("https://"):
-            gzip_url = file_name
-            file_name = file_name.rsplit("/", 1)[1]
-            req = requests.get(gzip_url).content
-            with open(file_name, "wb") as f:
-                f.write(req)
-            should_delete_file = True
-        with gzip.open(file_name, "rt", newline="") as f:
-            output = c.parse_csv(f)
-
-        if should_delete_file:
-            os.remove(file_name)
-        return output + c.thelist_cards
-
-    @staticmethod
-    def get_cards_from_row(row: dict[str, str]) -> list[str]:
-        cards = []
-        for k, v in row.items():
-            if k.startswith("pack_card_"):
-                card_name = k[10:]
-                for i in range(int(v)):
-                    cards.append(card_name)
-        return cards
-
-    def make_draft(self, rows: list[dict[str, str]]) -> DraftParseResponse:
-        if rows[0]["expansion"] != FORMAT.set_code:
+    def parse_gzip(
+        cls,
+        fmt: FormatData,
+        file_name: str,
+        user: model.Player,
+        cards: list[model.Card],
+        client: ScryfallClient,
+        *,
+        stream: bool = True,
+        count: int = DEFAULT_DRAFT_COUNT,
+        sample: bool = False,
+        collect_stats: bool = False,
+        workers: int | None = None,
+        seed: bytes | None = None,
+    ) -> ParsedSet:
+        """
+        Returns the drafts, the card statistics (if requested) and the The List cards found in the file.
+        """
+
+        c = cls(fmt, user, cards, client)
+        result = ParsedSet()
+        if sample or collect_stats:
+            # the counters need the whole file, so the first drafts are taken in the same pass
+            with open_draft_file(file_name, stream=stream) as f:
+                result.drafts, counters = c.scan_csv(
+                    f, count, sample=sample, collect_stats=collect_stats, workers=workers, seed=seed
+                )
+            if counters is not None:
+                result.card_stats = c.make_card_stats(counters)
+        else:
+            with open_draft_file(file_name, stream=stream) as f:
+                # parse_csv stops reading as soon as it has enough drafts, which also ends the download
+                result.drafts = c.parse_csv(io.TextIOWrapper(f, encoding="utf-8", newline=""), count)
+        result.cards = c.thelist_cards
+        return result
+
+    def get_cards_from_pack(self, pack: numpy.ndarray) -> list[model.Card]:
+        columns = numpy.flatnonzero(pack)
+        return [self.column_cards[i] for i in numpy.repeat(columns, pack[columns])]
+
+    def make_draft(self, rows: list[scan.DraftRow]) -> DraftParseResponse:
+        if rows[0].expansion != self.format.set_code:
             return DraftParseResponse()
-        if len({r["draft_id"] for r in rows}) != 1:
-            last_draft_count = sum(x["draft_id"] == rows[-1]["draft_id"] for x in rows)
+        if len({r.draft_id for r in rows}) != 1:
+            last_draft_count = sum(x.draft_id == rows[-1].draft_id for x in rows)
             skips = len(rows) - last_draft_count
             return DraftParseResponse(skip_lines=skips)
 
@@ -115,8 +240,8 @@ class DraftParser:
         row_cards = []
         picks = []
         for r in rows:
-            picks.append(self.cards[r["pick"]])
-            row_cards.append([self.cards[c] for c in self.get_cards_from_row(r)])
+            picks.append(self.cards[r.pick])
+            row_cards.append(self.get_cards_from_pack(r.pack))
         front_card = max(
             [c for c in row_cards[0] if c.layout not in BAD_LAYOUTS],
             key=lambda c: (
@@ -135,11 +260,15 @@ class DraftParser:
         run = model.DraftRun(player=self.player, draft_picks=draft_picks, is_original=True)
         return DraftParseResponse(
             item=model.Draft(
-                draft_options=draft_options, draft_runs=[run], front_card=front_card, first_player=self.player
+                draft_options=draft_options,
+                draft_runs=[run],
+                front_card=front_card,
+                first_player=self.player,
+                source_id=rows[0].draft_id,
             )
         )
 
-    def parse_csv(self, contents: IO[str]) -> list[model.Draft]:
+    def parse_csv(self, contents: IO[str], count: int = DEFAULT_DRAFT_COUNT) -> list[model.Draft]:
         # We're only extracting a small number of drafts from the CSV to not clog the database
         # because the CSV file is actually 4 gb in size even for new formats (MKM)
         # We also assume that all drafts are different because the chance for even the first
@@ -147,40 +276,262 @@ class DraftParser:
         draft_duration = self.format.picks_per_pack * 3
         already_extracted = []
 
-        reader = csv.DictReader(contents)
-        # the list, lmao.
-        all_cards = [x[10:] for x in reader.fieldnames if x.startswith("pack_card_")]
-        thelist_card_names = [c for c in all_cards if c not in self.cards]
-        self.thelist_cards = fetch_the_list(thelist_card_names)
-        self.add_cards(self.thelist_cards)
+        reader = csv.reader(contents)
+        decoder = scan.RowDecoder(next(reader))
+        self.load_columns(decoder)
         try:
-            for i in range(25):
-                rows = [next(reader) for _ in range(draft_duration)]
+            while len(already_extracted) < count:
+                rows = [decoder.decode(next(reader)) for _ in range(draft_duration)]
                 draft = self.make_draft(rows)
                 if draft.item:
                     already_extracted.append(draft.item)
                 if draft.skip_lines:
                     for _ in range(draft.skip_lines):
                         next(reader)
-        except StopIteration:  # we have less than 25 drafts wtf
+        except StopIteration:  # we have less drafts than requested wtf
             pass
 
         return already_extracted
 
+    def scan_csv(
+        self,
+        contents: IO[bytes],
+        count: int,
+        *,
+        sample: bool = True,
+        collect_stats: bool = False,
+        workers: int | None = None,
+        seed: bytes | None = None,
+    ) -> tuple[list[model.Draft], scan.CardCounters | None]:
+        # Unlike parse_csv, this reads the whole file, so with `sample` the drafts are not biased
+        # towards the start of the format. Without it, these are the first drafts, like parse_csv
+        header = scan.read_header(contents)
+        self.load_columns(scan.RowDecoder(header))
+        draft_duration = self.format.picks_per_pack * 3
+        samples, counters = scan.scan_drafts(
+            contents,
+            header,
+            self.format.set_code,
+            draft_duration,
+            count,
+            sample=sample,
+            collect_stats=collect_stats,
+            workers=workers,
+            seed=seed,
+        )
+        return [draft.item for rows in samples if (draft := self.make_draft(rows)).item], counters
 
-def do_imports(db_url: str, lands_file_name: str):
-    EngineGlobal.setup(db_url)
-    db = EngineGlobal.DBConnection()
-    user = model.Player(login="$17lands", name="a 17lands user", password="", virtual=True)
-    cards = fetch_cards(FORMAT.set_code.lower())
-    drafts = DraftParser.parse_gzip(lands_file_name, user, cards)  # also includes The List cards
+    def make_card_stats(self, counters: scan.CardCounters) -> list[model.CardStats]:
+        stats = {}
+        for i, card in enumerate(self.column_cards):
+            # cards that we don't know can't be shown anyway
+            if card is None or card.name in stats:
+                continue
+            stats[card.name] = model.CardStats(
+                set_code=self.format.set_code,
+                card=card,
+                seen=int(counters.seen[i]),
+                picked=int(counters.picked[i]),
+                pick_position_total=int(counters.pick_position_total[i]),
+                seen_early=int(counters.seen_early[i]),
+                picked_early=int(counters.picked_early[i]),
+            )
+        return list(stats.values())
+
+
+def remove_imported_drafts(conn: Connection, drafts: list[model.Draft]) -> list[model.Draft]:
+    """
+    Returns the drafts that aren't in the database yet, identified by their 17lands draft ID.
+    """
+
+    source_ids = [d.source_id for d in drafts]
+    seen = set()
+    for start in range(0, len(source_ids), SOURCE_ID_CHUNK):
+        chunk = source_ids[start : start + SOURCE_ID_CHUNK]
+        seen.update(
+            conn.execute(select(model.Draft.source_id).where(model.Draft.source_id.in_(chunk))).scalars()
+        )
+
+    new_drafts = []
+    for d in drafts:
+        if d.source_id not in seen:
+            seen.add(d.source_id)
+            new_drafts.append(d)
+    return new_drafts
+
+
+def load_drafts(conn: Connection, player: model.Player, parsed: ParsedSet) -> int:
+    """
+    Writes the parsed drafts using bulk inserts instead of the ORM unit of work. All primary keys
+    that other rows refer to are reserved here (see bulk.reserve_ids), so the rows can be inserted
+    table by table while the API keeps saving playthroughs.
+    The drafts are added to the ones already in the database, reusing the player and the cards
+    of earlier imports. Returns the amount of inserted rows.
+    """
 
-    db.add(user)
-    db.add_all(cards)
-    db.add_all(drafts)
+    tables = model.Base.metadata.tables
+    existing_player = conn.execute(select(model.Player.id).where(model.Player.login == player.login)).scalar()
+    player.id = existing_player or bulk.reserve_ids(conn, tables["players"], 1)[0]
 
+    # cards are identified by slug and set, because The List cards can be fetched more than once
+    card_ids: dict[tuple[str, str], int] = {
+        (slug, set_code): card_id
+        for card_id, slug, set_code in conn.execute(select(model.Card.id, model.Card.slug, model.Card.set))
+    }
+    new_cards: dict[tuple[str, str], model.Card] = {}
+    for c in parsed.cards:
+        if (c.slug, c.set) not in card_ids:
+            new_cards.setdefault((c.slug, c.set), c)
+    card_rows = []
+    for (key, c), card_id in zip(new_cards.items(), bulk.reserve_ids(conn, tables["cards"], len(new_cards))):
+        card_ids[key] = card_id
+        card_rows.append((card_id, c.name, c.image, c.art_image, c.slug, c.layout, c.rarity, c.set))
+    for c in parsed.cards:
+        c.id = card_ids[c.slug, c.set]
+
+    def card_id_of(c: model.Card) -> int:
+        return card_ids[c.slug, c.set]
+
+    draft_rows, run_rows, option_rows, pick_rows = [], [], [], []
+    picks_per_run: list[tuple[int, list[int]]] = []
+    draft_ids = bulk.reserve_ids(conn, tables["drafts"], len(parsed.drafts))
+    run_ids = iter(
+        bulk.reserve_ids(conn, tables["draft_runs"], sum(len(d.draft_runs) for d in parsed.drafts))
+    )
+    for draft, draft_id in zip(parsed.drafts, draft_ids):
+        draft_rows.append(
+            (draft_id, card_id_of(draft.front_card), player.id, len(draft.draft_runs), draft.source_id)
+        )
+        for o in draft.draft_options:
+            option_rows.append((draft_id, o.turn_number, o.option_number, card_id_of(o.card)))
+        for run in draft.draft_runs:
+            run_id = next(run_ids)
+            run_rows.append((run_id, draft_id, player.id, run.is_original))
+            picks = [card_id_of(p.picked_card) for p in run.draft_picks]
+            pick_rows.extend((run_id, turn, card) for turn, card in enumerate(picks))
+            picks_per_run.append((draft_id, picks))
+
+    player_rows = (
+        [] if existing_player else [(player.id, player.login, player.name, player.password, player.virtual)]
+    )
+    total = bulk.insert_rows(
+        conn, tables["players"], ["id", "login", "name", "password", "virtual"], player_rows
+    )
+    total += bulk.insert_rows(
+        conn,
+        tables["cards"],
+        ["id", "name", "image", "art_image", "slug", "layout", "rarity", "set"],
+        card_rows,
+    )
+    total += bulk.insert_rows(
+        conn,
+        tables["drafts"],
+        ["id", "front_card_id", "first_player_id", "run_count", "source_id"],
+        draft_rows,
+    )
+    total += bulk.insert_rows(
+        conn, tables["draft_runs"], ["id", "draft_id", "player_id", "is_original"], run_rows
+    )
+    total += bulk.insert_rows(
+        conn, tables["draft_options"], ["draft_id", "turn_number", "option_number", "card_id"], option_rows
+    )
+    total += bulk.insert_rows(
+        conn, tables["draft_picks"], ["draft_run_id", "turn_number", "picked_card_id"], pick_rows
+    )
+    total += bulk.insert_rows(
+        conn,
+        tables["draft_pick_counts"],
+        ["draft_id", "turn_number", "card_id", "count"],
+        [(*key, count) for key, count in aggregates.count_picks(picks_per_run).items()],
+    )
+    stat_rows = [
+        (
+            s.set_code,
+            card_id_of(s.card),
+            s.seen,
+            s.picked,
+            s.pick_position_total,
+            s.seen_early,
+            s.picked_early,
+        )
+        for s in parsed.card_stats
+    ]
+    # the statistics cover the whole file, so they replace the ones of the previous import of the set
+    stat_sets = {s.set_code for s in parsed.card_stats}
+    conn.execute(delete(model.CardStats).where(model.CardStats.set_code.in_(stat_sets)))
+    total += bulk.insert_rows(
+        conn,
+        tables["card_stats"],
+        ["set_code", "card_id", "seen", "picked", "pick_position_total", "seen_early", "picked_early"],
+        stat_rows,
+    )
+    if draft_ids:
+        scoring.score_drafts(conn, draft_ids[0], draft_ids[-1] + 1)
+    return total
+
+
+def import_set(
+    job: ImportJob, user: model.Player, *, stream: bool = True, refresh: bool = False, **parse_options
+) -> ParsedSet:
+    client = ScryfallClient.from_config(refresh=refresh)
+    cards = fetch_cards(job.format.set_code.lower(), client)
+    parsed = DraftParser.parse_gzip(
+        job.format, job.file_name, user, cards, client, stream=stream, **parse_options
+    )
+    parsed.cards = cards + parsed.cards
+    return parsed
+
+
+def do_imports(
+    db_url: str,
+    jobs: list[ImportJob],
+    *,
+    reset: bool = False,
+    prewarm_images: bool = False,
+    **import_options,
+) -> ImportStats:
+    """
+    Parses the jobs and adds their drafts to the database, after migrating it to the current schema.
+    Drafts that were imported before are skipped. With `reset`, the database is emptied first (including the saved playthroughs). With `prewarm_images`,
+    the images of the cards (and the art of the front cards) are downloaded into the image cache.
+    """
+
+    user = model.Player(login="$17lands", name="a 17lands user", password="", virtual=True)
+    parsed = ParsedSet()
+    if len(jobs) == 1:
+        parsed = import_set(jobs[0], user, **import_options)
+    else:
+        # every set is parsed in its own process, and the results are loaded into the database together
+        scans = import_options.get("sample") or import_options.get("collect_stats")
+        if scans and not import_options.get("workers"):
+            import_options["workers"] = max(1, (os.cpu_count() or 1) // len(jobs))
+        with concurrent.futures.ProcessPoolExecutor(len(jobs)) as pool:
+            futures = [pool.submit(import_set, job, user, **import_options) for job in jobs]
+            for future in futures:
+                parsed.extend(future.result())
+
+    EngineGlobal.setup(db_url)
     with EngineGlobal.engine.begin() as conn:
-        model.Base.metadata.drop_all(conn)
-        model.Base.metadata.create_all(conn)
-    db.commit()
+        if reset:
+            migrations.reset(conn)
+        else:
+            migrations.upgrade(conn)
+        start = time.perf_counter()
+        parsed_drafts = len(parsed.drafts)
+        parsed.drafts = remove_imported_drafts(conn, parsed.drafts)
+        rows = load_drafts(conn, user, parsed)
+        # committed together with the drafts, so servers with a snapshot of them reload it
+        conn.execute(insert(model.ImportGeneration))
+    stats = ImportStats(
+        rows=rows, seconds=time.perf_counter() - start, skipped_drafts=parsed_drafts - len(parsed.drafts)
+    )
     EngineGlobal.destroy()
+
+    if prewarm_images:
+        urls = [c.image for c in parsed.cards] + [d.front_card.art_image for d in parsed.drafts]
+        stats.images = ImageCache.from_config().prewarm(urls)
+    return stats
+
+
+if app_config.FORMATS_FILE:
+    load_formats(app_config.FORMATS_FILE)
@@ -0,0 +1,122 @@
+import time
+
+from prometheus_client import REGISTRY, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import Engine, event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from eightpack import querycount
+from eightpack.core import EngineGlobal
+from eightpack.kdf import KDFExecutor
+
+REQUEST_LATENCY = Histogram(
+    "eightpack_request_duration_seconds",
+    "Time spent handling HTTP requests",
+    ["method", "route", "status"],
+)
+QUERY_DURATION = Histogram(
+    "eightpack_db_query_duration_seconds",
+    "Time spent executing database queries",
+    ["statement"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+class MetricsMiddleware:
+    """
+    Measures the latency of every request, labelled with the route template (like /drafts/{draft_id}/choices)
+    rather than the actual path, to keep the amount of time series bounded.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # the router stores the matched route in the scope
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"], route.path if route is not None else "unmatched", str(status)
+            ).observe(time.perf_counter() - start)
+
+
+def instrument_engine(engine: Engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, _cursor, _statement, _parameters, _context, _executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, _cursor, statement: str, _parameters, _context, _executemany):
+        seconds = time.perf_counter() - conn.info["query_start"].pop()
+        verb = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "unknown"
+        QUERY_DURATION.labels(verb).observe(seconds)
+        querycount.record(statement, seconds)
+
+
+class PoolCollector(Collector):
+    """
+    Reads the state of the connection pool of EngineGlobal on every scrape.
+    """
+
+    def collect(self):
+        pool = EngineGlobal.engine.pool if EngineGlobal.engine is not None else None
+        # pools that don't keep connections around (like SQLite's in-memory one) have nothing to report
+        if pool is None or not hasattr(pool, "checkedout"):
+            return
+        for name, documentation, value in [
+            ("size", "Connections the pool keeps open", pool.size()),
+            ("checked_out", "Connections currently in use", pool.checkedout()),
+            ("checked_in", "Idle connections in the pool", pool.checkedin()),
+            ("overflow", "Connections opened above the pool size", max(0, pool.overflow())),
+        ]:
+            yield GaugeMetricFamily(f"eightpack_db_pool_{name}", documentation, value=value)
+
+
+class KDFCollector(Collector):
+    def __init__(self, executor: KDFExecutor):
+        self.executor = executor
+
+    def collect(self):
+        metrics = self.executor.metrics()
+        yield GaugeMetricFamily(
+            "eightpack_kdf_queue_depth", "Password hashes waiting for a worker", value=metrics.queue_depth
+        )
+        yield GaugeMetricFamily(
+            "eightpack_kdf_in_progress", "Password hashes being computed", value=metrics.in_progress
+        )
+        yield CounterMetricFamily(
+            "eightpack_kdf_completed", "Password hashes computed", value=metrics.completed
+        )
+        yield CounterMetricFamily(
+            "eightpack_kdf_rejected",
+            "Password hashes refused because of a full queue",
+            value=metrics.rejected,
+        )
+        latency = GaugeMetricFamily(
+            "eightpack_kdf_latency_seconds", "Latency of recent password hashes", labels=["quantile"]
+        )
+        for quantile, value in [("0.5", metrics.latency_p50), ("0.95", metrics.latency_p95)]:
+            if value is not None:
+                latency.add_metric([quantile], value)
+        yield latency
+
+
+def register_collectors(kdf: KDFExecutor):
+    REGISTRY.register(PoolCollector())
+    REGISTRY.register(KDFCollector(kdf))
@@ -0,0 +1,129 @@
+"""
+Versioned schema changes. A new database is created from the models directly and marked as up to date,
+an existing one gets every migration it hasn't had yet, in order, each recorded in `schema_versions`.
+Migrations are written against the models at the time they're added, and must keep working on
+databases created from later models (so they check what already exists).
+"""
+
+import dataclasses
+import logging
+from typing import Callable
+
+from sqlalchemy import Column, Connection, func, inspect, insert, select, text, update
+
+from eightpack import aggregates, model, scoring
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(version: int, description: str):
+    def decorator(fn: Callable[[Connection], None]):
+        assert not MIGRATIONS or MIGRATIONS[-1].version < version, "Migrations must be added in order!"
+        MIGRATIONS.append(Migration(version, description, fn))
+        return fn
+
+    return decorator
+
+
+def add_column(conn: Connection, column: Column) -> bool:
+    """
+    Adds a column of the models to its table, unless it's already there. Returns whether it was added.
+    """
+
+    columns = {c["name"] for c in inspect(conn).get_columns(column.table.name)}
+    if column.name in columns:
+        return False
+
+    quote = conn.dialect.identifier_preparer.quote
+    ddl = f"ALTER TABLE {quote(column.table.name)} ADD COLUMN {quote(column.name)} "
+    ddl += column.type.compile(dialect=conn.dialect)
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    conn.execute(text(ddl))
+    return True
+
+
+@migration(1, "Add the denormalized run counts, pick counts, card stats and scores")
+def add_derived_data(conn: Connection):
+    tables = model.Base.metadata.tables
+    model.Base.metadata.create_all(
+        conn, tables=[tables["draft_pick_counts"], tables["card_stats"], tables["import_generations"]]
+    )
+    if add_column(conn, model.Draft.__table__.c.run_count):
+        counts = select(func.count()).where(model.DraftRun.draft_id == model.Draft.id).scalar_subquery()
+        conn.execute(update(model.Draft).values(run_count=counts))
+    added_scores = add_column(conn, model.DraftRun.__table__.c.original_agreement)
+    added_scores |= add_column(conn, model.DraftRun.__table__.c.majority_agreement)
+    if not conn.execute(select(model.DraftPickCount.draft_id).limit(1)).first():
+        aggregates.rebuild_pick_counts(conn)
+    if added_scores:
+        scoring.score_all_runs(conn)
+
+
+@migration(2, "Add covering indexes for the foreign keys that are filtered on")
+def add_foreign_key_indexes(conn: Connection):
+    for table in ["draft_options", "draft_runs", "draft_picks"]:
+        for index in model.Base.metadata.tables[table].indexes:
+            index.create(conn, checkfirst=True)
+
+
+@migration(3, "Store the 17lands draft IDs of the imported drafts")
+def add_draft_source_ids(conn: Connection):
+    # drafts imported before this have no source ID, so they can still be imported again once
+    add_column(conn, model.Draft.__table__.c.source_id)
+    for index in model.Draft.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def current_version(conn: Connection) -> int | None:
+    """
+    The last applied migration, 0 for a database created before migrations, None for an empty one.
+    """
+
+    if inspect(conn).has_table(model.SchemaVersion.__tablename__):
+        return conn.execute(select(func.max(model.SchemaVersion.version))).scalar() or 0
+    return 0 if inspect(conn).has_table(model.Draft.__tablename__) else None
+
+
+def upgrade(conn: Connection) -> list[Migration]:
+    """
+    Brings the schema up to date. Returns the applied migrations.
+    """
+
+    version = current_version(conn)
+    if version is None:
+        model.Base.metadata.create_all(conn)
+        conn.execute(insert(model.SchemaVersion), [{"version": m.version} for m in MIGRATIONS])
+        return []
+
+    model.SchemaVersion.__table__.create(conn, checkfirst=True)
+    applied = []
+    for m in MIGRATIONS:
+        if m.version <= version:
+            continue
+        logger.info("Applying migration %d: %s", m.version, m.description)
+        m.apply(conn)
+        conn.execute(insert(model.SchemaVersion).values(version=m.version))
+        applied.append(m)
+    return applied
+
+
+def reset(conn: Connection):
+    """
+    Drops everything, including the saved playthroughs, and creates an up to date schema.
+    """
+
+    model.Base.metadata.drop_all(conn)
+    upgrade(conn)
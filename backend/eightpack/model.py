@@ -1,6 +1,7 @@
-from sqlalchemy import inspect, ForeignKey, String, DateTime, func, UniqueConstraint, select
-from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, column_property
+from uuid import uuid4
+
+from sqlalchemy import inspect, ForeignKey, String, DateTime, func, UniqueConstraint, Index
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
 class Base(DeclarativeBase):
@@ -19,6 +20,16 @@ class DraftPick(Base):
     picked_card_id: Mapped[int] = mapped_column(ForeignKey("cards.id"))
     picked_card: Mapped["Card"] = relationship()
 
+    # the picks of a page of runs are loaded by run ID, from the index alone on Postgres
+    __table_args__ = (
+        Index(
+            "ix_draft_picks_draft_run_id",
+            "draft_run_id",
+            "turn_number",
+            postgresql_include=["id", "picked_card_id"],
+        ),
+    )
+
 
 class DraftOption(Base):
     __tablename__ = "draft_options"
@@ -29,7 +40,16 @@ class DraftOption(Base):
     card_id: Mapped[int] = mapped_column(ForeignKey("cards.id"))
     card: Mapped["Card"] = relationship()
 
-    __table_args__ = (UniqueConstraint("turn_number", "option_number", "draft_id"),)
+    __table_args__ = (
+        UniqueConstraint("turn_number", "option_number", "draft_id"),
+        Index(
+            "ix_draft_options_draft_id",
+            "draft_id",
+            "turn_number",
+            "option_number",
+            postgresql_include=["id", "card_id"],
+        ),
+    )
 
 
 class DraftRun(Base):
@@ -38,16 +58,29 @@ class DraftRun(Base):
     draft_id: Mapped[int] = mapped_column(ForeignKey("drafts.id"))
     player_id: Mapped[int] = mapped_column(ForeignKey("players.id"))
     player: Mapped["Player"] = relationship()
-    draft_picks: Mapped[list[DraftPick]] = relationship()
+    draft_picks: Mapped[list[DraftPick]] = relationship(order_by=DraftPick.turn_number)
     draft: Mapped["Draft"] = relationship(back_populates="draft_runs")
-    created_at: Mapped[int] = mapped_column(DateTime(), server_default=func.now(), onupdate=func.now())
+    created_at: Mapped[int] = mapped_column(DateTime(), server_default=func.now())
     is_original: Mapped[bool] = mapped_column(default=False)
+    # how many picks are the same as in the original run, and as the most popular pick (see scoring.py)
+    original_agreement: Mapped[int | None] = mapped_column(nullable=True)
+    majority_agreement: Mapped[int | None] = mapped_column(nullable=True)
+
+    __table_args__ = (
+        # playthroughs of a draft are paginated by ID
+        Index("ix_draft_runs_draft_id", "draft_id", "id"),
+        Index(
+            "ix_draft_runs_player_id",
+            "player_id",
+            postgresql_include=["is_original", "original_agreement", "majority_agreement"],
+        ),
+    )
 
 
 class Draft(Base):
     __tablename__ = "drafts"
     id: Mapped[int] = mapped_column(primary_key=True)
-    created_at: Mapped[int] = mapped_column(DateTime(), server_default=func.now(), onupdate=func.now())
+    created_at: Mapped[int] = mapped_column(DateTime(), server_default=func.now())
     draft_runs: Mapped[list[DraftRun]] = relationship(back_populates="draft")
     draft_options: Mapped[list[DraftOption]] = relationship()
     front_card_id: Mapped[int] = mapped_column(ForeignKey("cards.id"))
@@ -55,9 +88,24 @@ class Draft(Base):
     first_player_id: Mapped[int] = mapped_column(ForeignKey("players.id"))
     first_player: Mapped["Player"] = relationship()
 
-    run_count: Mapped[int] = column_property(
-        select(func.count()).where(DraftRun.draft_id == id).scalar_subquery()
-    )
+    # kept up to date by whatever adds DraftRuns, so that listing drafts doesn't have to count them
+    run_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    # the draft_id of the 17lands file, so that importing a file again doesn't add its drafts twice
+    source_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
+    __table_args__ = (Index("ix_drafts_source_id", "source_id", unique=True),)
+
+
+class DraftPickCount(Base):
+    """
+    How many runs of a draft picked a card on a turn, kept up to date together with the runs.
+    """
+
+    __tablename__ = "draft_pick_counts"
+    draft_id: Mapped[int] = mapped_column(ForeignKey("drafts.id"), primary_key=True)
+    turn_number: Mapped[int] = mapped_column(primary_key=True)
+    card_id: Mapped[int] = mapped_column(ForeignKey("cards.id"), primary_key=True)
+    count: Mapped[int] = mapped_column(default=0)
 
 
 class Card(Base):
@@ -84,3 +132,41 @@ class Player(Base):
     virtual: Mapped[bool] = mapped_column(default=False)
 
     __table_args__ = (UniqueConstraint("login"),)
+
+
+class SchemaVersion(Base):
+    """
+    A row for every migration applied to the database, see migrations.py.
+    """
+
+    __tablename__ = "schema_versions"
+    version: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    applied_at: Mapped[int] = mapped_column(DateTime(), server_default=func.now())
+
+
+class ImportGeneration(Base):
+    """
+    Added by every import, so that running servers can tell that the drafts and cards have changed.
+    """
+
+    __tablename__ = "import_generations"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    token: Mapped[str] = mapped_column(String(32), default=lambda: uuid4().hex)
+    created_at: Mapped[int] = mapped_column(DateTime(), server_default=func.now())
+
+
+class CardStats(Base):
+    __tablename__ = "card_stats"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # The List cards are shared between sets, so the format is part of the key
+    set_code: Mapped[str] = mapped_column(String(8))
+    card_id: Mapped[int] = mapped_column(ForeignKey("cards.id"))
+    card: Mapped[Card] = relationship()
+
+    seen: Mapped[int] = mapped_column()
+    picked: Mapped[int] = mapped_column()
+    pick_position_total: Mapped[int] = mapped_column()
+    seen_early: Mapped[int] = mapped_column()
+    picked_early: Mapped[int] = mapped_column()
+
+    __table_args__ = (UniqueConstraint("set_code", "card_id"),)
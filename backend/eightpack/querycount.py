@@ -0,0 +1,137 @@
+"""
+Counts the queries run on behalf of each request, to catch N+1 queries (e.g. a lazy relationship loaded
+for every item of a list). The engine listeners in metrics.py report every query to `record`, which adds it
+to the QueryStats of the current context, if any.
+"""
+
+import collections
+import contextlib
+import contextvars
+import dataclasses
+import logging
+import re
+from typing import Callable, Iterator
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from eightpack.config import app_config
+
+logger = logging.getLogger(__name__)
+WHITESPACE = re.compile(r"\s+")
+# a parenthesized list of placeholders of any driver: (?, ?), ($1, $2), (%(id_1_1)s, %(id_1_2)s)
+PARAMETER_LIST = re.compile(r"\((?:\s*(?:\?|\$\d+|%\(\w+\)s)\s*,)*\s*(?:\?|\$\d+|%\(\w+\)s)\s*\)")
+
+
+def statement_shape(statement: str) -> str:
+    # IN lists and multi-row VALUES get a placeholder per value, which would make the same query look different
+    return PARAMETER_LIST.sub("(?)", WHITESPACE.sub(" ", statement)).strip()
+
+
+@dataclasses.dataclass
+class QueryStats:
+    count: int = 0
+    seconds: float = 0.0
+    shapes: collections.Counter[str] = dataclasses.field(default_factory=collections.Counter)
+
+    def add(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    @property
+    def max_repeats(self) -> int:
+        return max(self.shapes.values(), default=0)
+
+    def repeated(self, threshold: int = 2) -> list[tuple[str, int]]:
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+# shared by reference with the threads the request runs queries in, which get a copy of the context
+current_stats: contextvars.ContextVar[QueryStats | None] = contextvars.ContextVar(
+    "current_stats", default=None
+)
+# called with the method, the path and the stats of every finished request
+request_listeners: list[Callable[[str, str, QueryStats], None]] = []
+
+
+def record(statement: str, seconds: float):
+    if (stats := current_stats.get()) is not None:
+        stats.add(statement, seconds)
+
+
+class QueryCountMiddleware:
+    """
+    Collects the queries of every request. In debug mode, the count, the total time and the most repeated
+    statement are sent in the X-Query-Count, Server-Timing and X-Query-Repeats headers. A statement repeated
+    QUERY_REPEAT_WARNING times in one request is logged. Queries of saved playthroughs run in the batch
+    writer's task, not in the request, so they aren't counted.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = current_stats.set(stats)
+
+        async def send_with_headers(message: Message):
+            # StreamingResponse bodies are read after this, so their queries are only in the log
+            if message["type"] == "http.response.start" and app_config.DEBUG:
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Query-Count", str(stats.count))
+                headers.append("X-Query-Repeats", str(stats.max_repeats))
+                headers.append("Server-Timing", f"db;dur={stats.seconds * 1000:.2f}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            current_stats.reset(token)
+            for shape, n in stats.repeated(app_config.QUERY_REPEAT_WARNING):
+                logger.warning(
+                    "%s %s ran the same query %d times: %s", scope["method"], scope["path"], n, shape
+                )
+            for listener in request_listeners:
+                listener(scope["method"], scope["path"], stats)
+
+
+@contextlib.contextmanager
+def query_budget(max_queries: int, *, max_repeats: int = 1) -> Iterator[QueryStats]:
+    """
+    Fails with an AssertionError if the code inside the block, or any request finished inside it (e.g. made
+    with a TestClient), runs more than `max_queries` queries or the same statement more than `max_repeats`
+    times. Meant for tests, like:
+
+        with query_budget(2):
+            client.get("/drafts/1/playthroughs?page_size=50")
+    """
+
+    stats = QueryStats()
+    requests = [("the block", stats)]
+
+    def listener(method: str, path: str, request_stats: QueryStats):
+        requests.append((f"{method} {path}", request_stats))
+
+    token = current_stats.set(stats)
+    request_listeners.append(listener)
+    try:
+        yield stats
+    finally:
+        current_stats.reset(token)
+        request_listeners.remove(listener)
+
+    problems = []
+    for name, s in requests:
+        if s.count > max_queries:
+            problems.append(f"{name} ran {s.count} queries, more than {max_queries}")
+        problems += [
+            f"{name} ran this {n} times, more than {max_repeats}: {shape}"
+            for shape, n in s.repeated(max_repeats + 1)
+        ]
+    if problems:
+        raise AssertionError("Query budget exceeded:\n" + "\n".join(problems))
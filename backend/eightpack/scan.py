@@ -0,0 +1,275 @@
+import collections
+import concurrent.futures
+import csv
+import hashlib
+import heapq
+import io
+import itertools
+import os
+from typing import IO, Iterator, NamedTuple
+
+import numpy
+
+# Amount of decompressed data handed to a worker at once, rounded to whole drafts
+BLOCK_SIZE = 4 << 20
+# Keys are uniformly distributed 64-bit integers, so this is above every possible key
+NO_THRESHOLD = 1 << 64
+# Without sampling, the key of a draft is its position: the index of its block, then its place in the block
+BLOCK_KEY_SHIFT = 32
+
+_worker_state = {}
+
+
+class DraftRow(NamedTuple):
+    expansion: str
+    draft_id: str
+    pack_number: int
+    pick_number: int
+    pick: str
+    # copies of each card in the pack, in the order of RowDecoder.card_names
+    pack: numpy.ndarray
+
+
+class RowDecoder:
+    """
+    Turns rows of a 17lands file (as produced by csv.reader) into DraftRows. Column positions
+    are resolved from the header once, instead of going through every column name of every row.
+    """
+
+    def __init__(self, header: list[str]):
+        pack_columns = [i for i, name in enumerate(header) if name.startswith("pack_card_")]
+        if not pack_columns or pack_columns != list(range(pack_columns[0], pack_columns[-1] + 1)):
+            raise ValueError("Expected the pack_card_* columns to be next to each other!")
+
+        self.card_names = [header[i][10:] for i in pack_columns]
+        self.card_indices = {name: i for i, name in enumerate(self.card_names)}
+        self.pack_columns = slice(pack_columns[0], pack_columns[-1] + 1)
+        self.expansion_column = header.index("expansion")
+        self.draft_id_column = header.index("draft_id")
+        self.pack_number_column = header.index("pack_number")
+        self.pick_number_column = header.index("pick_number")
+        self.pick_column = header.index("pick")
+
+    def pack_counts(self, row: list[str]) -> numpy.ndarray:
+        counts = row[self.pack_columns]
+        # All counts are normally single digits, so the joined string has exactly one byte per card
+        digits = "".join(counts).encode("ascii")
+        if len(digits) == len(counts):
+            return numpy.frombuffer(digits, dtype=numpy.uint8) - ord("0")
+        return numpy.array(counts, dtype=numpy.uint8)
+
+    def decode(self, row: list[str]) -> DraftRow:
+        return DraftRow(
+            expansion=row[self.expansion_column],
+            draft_id=row[self.draft_id_column],
+            pack_number=int(row[self.pack_number_column]),
+            pick_number=int(row[self.pick_number_column]),
+            pick=row[self.pick_column],
+            pack=self.pack_counts(row),
+        )
+
+
+def read_header(f: IO[bytes]) -> list[str]:
+    return next(csv.reader([f.readline().decode("utf-8")]))
+
+
+def draft_id_of(line: bytes, column: int) -> bytes:
+    # the columns before draft_id (expansion, event_type) never contain commas or quotes
+    return line.split(b",", column + 1)[column]
+
+
+def draft_key(seed: bytes, draft_id: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(seed + b"\0" + draft_id, digest_size=8).digest(), "big")
+
+
+def iter_draft_blocks(f: IO[bytes], draft_id_column: int, block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """
+    Cuts the (headerless) rest of the file into blocks of complete lines, never splitting a draft
+    between two blocks. Assumes that all rows of a draft are stored next to each other, which
+    is true for the 17lands exports.
+    """
+
+    tail = b""
+    while chunk := f.read(block_size):
+        data = tail + chunk
+        boundary = data.rfind(b"\n") + 1
+        # go back one line at a time until we reach the first row of the last draft
+        last_id = None
+        while boundary > 0:
+            line_start = data.rfind(b"\n", 0, boundary - 1) + 1
+            line_id = draft_id_of(data[line_start:boundary], draft_id_column)
+            if last_id is not None and line_id != last_id:
+                break
+            last_id = line_id
+            boundary = line_start
+
+        if boundary > 0:
+            yield data[:boundary]
+        tail = data[boundary:]
+
+    if tail.strip():
+        yield tail
+
+
+class CardCounters:
+    """
+    Pick statistics of every card of a 17lands file, indexed like RowDecoder.card_names.
+    Counters of different parts of the file can be added together.
+    """
+
+    # "early" means the first 8 picks of the first pack, which is the part of the draft we show
+    FIELDS = ["seen", "picked", "pick_position_total", "seen_early", "picked_early"]
+    EARLY_PICKS = 8
+
+    def __init__(self, size: int):
+        self.rows = 0
+        self.counts = numpy.zeros((len(self.FIELDS), size), dtype=numpy.int64)
+
+    def __getattr__(self, item: str) -> numpy.ndarray:
+        if item in self.FIELDS:
+            return self.counts[self.FIELDS.index(item)]
+        raise AttributeError(item)
+
+    def __iadd__(self, other: "CardCounters") -> "CardCounters":
+        self.rows += other.rows
+        self.counts += other.counts
+        return self
+
+    @classmethod
+    def from_rows(cls, rows: list[DraftRow], decoder: RowDecoder) -> "CardCounters":
+        size = len(decoder.card_names)
+        counters = cls(size)
+        if not rows:
+            return counters
+
+        # one matrix for the whole block, so that every counter is a single NumPy operation
+        present = numpy.stack([r.pack for r in rows]) > 0
+        picks = numpy.array([decoder.card_indices.get(r.pick, -1) for r in rows])
+        pick_numbers = numpy.array([r.pick_number for r in rows])
+        early = (numpy.array([r.pack_number for r in rows]) == 0) & (pick_numbers < cls.EARLY_PICKS)
+        known = picks >= 0
+
+        counters.rows = len(rows)
+        counters.seen[:] = present.sum(axis=0)
+        counters.seen_early[:] = present[early].sum(axis=0)
+        counters.picked[:] = numpy.bincount(picks[known], minlength=size)
+        counters.picked_early[:] = numpy.bincount(picks[known & early], minlength=size)
+        counters.pick_position_total[:] = numpy.bincount(
+            picks[known], weights=pick_numbers[known] + 1, minlength=size
+        ).astype(numpy.int64)
+        return counters
+
+
+def _init_worker(
+    header: list[str], set_code: str, draft_duration: int, seed: bytes, sample: bool, collect_stats: bool
+):
+    _worker_state.update(
+        decoder=RowDecoder(header),
+        draft_id_column=header.index("draft_id"),
+        set_code=set_code,
+        draft_duration=draft_duration,
+        seed=seed,
+        sample=sample,
+        collect_stats=collect_stats,
+    )
+
+
+def _sample_lines(lines: list[bytes], threshold: int, block_index: int) -> list[tuple[int, list[DraftRow]]]:
+    state = _worker_state
+    column = state["draft_id_column"]
+    candidates = []
+
+    groups = itertools.groupby(lines, key=lambda ln: draft_id_of(ln, column))
+    for position, (draft_id, draft_lines) in enumerate(groups):
+        if state["sample"]:
+            key = draft_key(state["seed"], draft_id)
+        else:
+            key = (block_index << BLOCK_KEY_SHIFT) + position
+        if key >= threshold:
+            continue
+        draft_lines = list(draft_lines)
+        # unfinished drafts are skipped, same as when reading the head of the file
+        if len(draft_lines) < state["draft_duration"]:
+            continue
+
+        text = b"\n".join(draft_lines[:8]).decode("utf-8")
+        rows = [state["decoder"].decode(r) for r in csv.reader(io.StringIO(text, newline=""))]
+        if rows[0].expansion == state["set_code"]:
+            candidates.append((key, rows))
+    return candidates
+
+
+def _scan_block(
+    block: bytes, threshold: int, block_index: int
+) -> tuple[list[tuple[int, list[DraftRow]]], CardCounters | None]:
+    state = _worker_state
+    counters = None
+    if state["collect_stats"]:
+        decoder = state["decoder"]
+        rows = [decoder.decode(r) for r in csv.reader(io.StringIO(block.decode("utf-8"), newline=""))]
+        counters = CardCounters.from_rows([r for r in rows if r.expansion == state["set_code"]], decoder)
+    candidates = _sample_lines(block.splitlines(), threshold, block_index) if threshold > 0 else []
+    return candidates, counters
+
+
+def scan_drafts(
+    f: IO[bytes],
+    header: list[str],
+    set_code: str,
+    draft_duration: int,
+    count: int,
+    *,
+    sample: bool = True,
+    collect_stats: bool = False,
+    workers: int | None = None,
+    seed: bytes | None = None,
+) -> tuple[list[list[DraftRow]], CardCounters | None]:
+    """
+    Picks `count` drafts uniformly at random from the whole file (the rest of `f` after the header),
+    and optionally counts how every card was picked in the same pass.
+    Every draft gets a pseudorandom key derived from its ID, and the drafts with the smallest keys win.
+    Without `sample`, the key is the position of the draft instead, so the first `count` drafts win,
+    in file order. That is what to use when the whole file is read for the counters anyway.
+    Blocks are scanned by a process pool, while this process only decompresses the file and keeps
+    the current best candidates, which lets the workers ignore any draft that can no longer make it.
+    Returns the first 8 rows of each selected draft, and the card counters if requested.
+    """
+
+    workers = workers or os.cpu_count() or 1
+    seed = seed if seed is not None else os.urandom(16)
+    # max-heap (by negated key) of the best `count` candidates seen so far
+    best: list[tuple[int, str, list[DraftRow]]] = []
+    counters = CardCounters(len(RowDecoder(header).card_names)) if collect_stats else None
+
+    def threshold() -> int:
+        if count <= 0:
+            return 0
+        return -best[0][0] if len(best) >= count else NO_THRESHOLD
+
+    def collect(future: concurrent.futures.Future):
+        nonlocal counters
+        candidates, block_counters = future.result()
+        if block_counters is not None:
+            counters += block_counters
+        for key, rows in candidates:
+            item = (-key, rows[0].draft_id, rows)
+            if len(best) < count:
+                heapq.heappush(best, item)
+            elif key < -best[0][0]:
+                heapq.heapreplace(best, item)
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(header, set_code, draft_duration, seed, sample, collect_stats),
+    ) as pool:
+        pending = collections.deque()
+        for block_index, block in enumerate(iter_draft_blocks(f, header.index("draft_id"))):
+            # limits the amount of blocks in memory at the same time
+            if len(pending) >= workers * 2:
+                collect(pending.popleft())
+            pending.append(pool.submit(_scan_block, block, threshold(), block_index))
+        while pending:
+            collect(pending.popleft())
+
+    return [rows for _, _, rows in sorted(best, reverse=True)], counters
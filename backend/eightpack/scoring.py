@@ -0,0 +1,159 @@
+import itertools
+from typing import Sequence
+
+import numpy
+from sqlalchemy import Connection, bindparam, func, select, update
+
+from eightpack import bulk, model
+
+TURNS = 8
+# amount of drafts whose runs are scored at once by score_all_runs
+DRAFTS_PER_CHUNK = 5000
+
+
+def agreement_scores(
+    picks: numpy.ndarray, originals: numpy.ndarray, pick_counts: numpy.ndarray, max_counts: numpy.ndarray
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Scores runs given as (runs x turns) matrices: the picked cards, the cards picked in the original run
+    of the same draft (-1 if there's none), how many runs picked the same card on that turn, and how many
+    runs picked the most popular card. Returns how many picks of each run agree with the original run,
+    and how many agree with the majority (every card tied for the most picks counts as the majority).
+    """
+
+    original_scores = (picks == originals).sum(axis=1)
+    majority_scores = (pick_counts == max_counts).sum(axis=1)
+    return original_scores, majority_scores
+
+
+def _store_scores(
+    conn: Connection,
+    run_ids: Sequence[int],
+    original_scores: Sequence[int | None],
+    majority_scores: Sequence[int],
+):
+    table = model.DraftRun.__table__
+    statement = (
+        update(table)
+        .where(table.c.id == bindparam("b_id"))
+        .values(original_agreement=bindparam("b_original"), majority_agreement=bindparam("b_majority"))
+    )
+    rows = (
+        {"b_id": run_id, "b_original": original, "b_majority": majority}
+        for run_id, original, majority in zip(run_ids, original_scores, majority_scores)
+    )
+    while batch := list(itertools.islice(rows, bulk.BATCH_SIZE)):
+        conn.execute(statement, batch)
+
+
+def score_drafts(conn: Connection, first_draft_id: int, last_draft_id: int) -> int:
+    """
+    Scores every run of the drafts with IDs in [first_draft_id, last_draft_id) from scratch.
+    All picks of the range are loaded into one array, and the scores are computed with grouped
+    NumPy operations instead of per-run queries. Returns the amount of scored runs.
+    """
+
+    query = (
+        select(
+            model.DraftRun.id,
+            model.DraftRun.draft_id,
+            model.DraftRun.is_original,
+            model.DraftPick.turn_number,
+            model.DraftPick.picked_card_id,
+        )
+        .join(model.DraftPick, model.DraftPick.draft_run_id == model.DraftRun.id)
+        .where(model.DraftRun.draft_id >= first_draft_id, model.DraftRun.draft_id < last_draft_id)
+    )
+    rows = numpy.array(conn.execute(query).all(), dtype=numpy.int64).reshape(-1, 5)
+    if not len(rows):
+        return 0
+    run_column, draft_column, original_column, turn_column, card_column = rows.T
+
+    run_ids, run_index = numpy.unique(run_column, return_inverse=True)
+    # every (draft, turn) pair is a group, the picks of a group are compared with each other
+    groups, group_index = numpy.unique(draft_column * TURNS + turn_column, return_inverse=True)
+    _, card_index, card_counts = numpy.unique(
+        group_index * (card_column.max() + 1) + card_column, return_inverse=True, return_counts=True
+    )
+    pick_counts = card_counts[card_index]
+    max_counts = numpy.zeros(len(groups), dtype=numpy.int64)
+    numpy.maximum.at(max_counts, group_index, pick_counts)
+
+    original_cards = numpy.full(len(groups), -1, dtype=numpy.int64)
+    is_original = original_column == 1
+    original_cards[group_index[is_original]] = card_column[is_original]
+    pick_originals = original_cards[group_index]
+
+    # the picks aren't a full matrix here (a run could miss picks), so the sums are done per run instead
+    original_scores = numpy.bincount(run_index, weights=card_column == pick_originals, minlength=len(run_ids))
+    majority_scores = numpy.bincount(
+        run_index, weights=pick_counts == max_counts[group_index], minlength=len(run_ids)
+    )
+    has_original = numpy.bincount(run_index, weights=pick_originals >= 0, minlength=len(run_ids)) > 0
+
+    _store_scores(
+        conn,
+        run_ids.tolist(),
+        [int(s) if has else None for s, has in zip(original_scores, has_original)],
+        majority_scores.astype(numpy.int64).tolist(),
+    )
+    return len(run_ids)
+
+
+def score_all_runs(conn: Connection, drafts_per_chunk: int = DRAFTS_PER_CHUNK) -> int:
+    """
+    Rescores every run, a chunk of drafts at a time to keep the memory use bounded.
+    """
+
+    first, last = conn.execute(select(func.min(model.Draft.id), func.max(model.Draft.id))).one()
+    if first is None:
+        return 0
+    return sum(
+        score_drafts(conn, start, start + drafts_per_chunk)
+        for start in range(first, last + 1, drafts_per_chunk)
+    )
+
+
+def score_new_runs(
+    conn: Connection, run_ids: Sequence[int], draft_ids: Sequence[int], picks: list[Sequence[int]]
+):
+    """
+    Scores freshly saved runs against the current pick counts of their drafts, which must already include
+    the new runs. Scores of the older runs of the same drafts are left as they are until the next
+    score_all_runs, even though the majority may have changed.
+    """
+
+    drafts = set(draft_ids)
+    originals = conn.execute(
+        select(model.DraftRun.draft_id, model.DraftPick.turn_number, model.DraftPick.picked_card_id)
+        .join(model.DraftPick, model.DraftPick.draft_run_id == model.DraftRun.id)
+        .where(model.DraftRun.is_original, model.DraftRun.draft_id.in_(drafts))
+    ).all()
+    original_cards = {(d, t): c for d, t, c in originals}
+    counts = conn.execute(
+        select(
+            model.DraftPickCount.draft_id,
+            model.DraftPickCount.turn_number,
+            model.DraftPickCount.card_id,
+            model.DraftPickCount.count,
+        ).where(model.DraftPickCount.draft_id.in_(drafts))
+    ).all()
+    pick_counts = {(d, t, c): n for d, t, c, n in counts}
+    max_counts = {}
+    for d, t, _, n in counts:
+        max_counts[d, t] = max(n, max_counts.get((d, t), 0))
+
+    turns = range(TURNS)
+    original_scores, majority_scores = agreement_scores(
+        numpy.array(picks),
+        numpy.array([[original_cards.get((d, t), -1) for t in turns] for d in draft_ids]),
+        numpy.array([[pick_counts.get((d, t, p[t]), 0) for t in turns] for d, p in zip(draft_ids, picks)]),
+        numpy.array([[max_counts.get((d, t), 0) for t in turns] for d in draft_ids]),
+    )
+    has_original = {d for d, _ in original_cards}
+    _store_scores(
+        conn,
+        run_ids,
+        [int(s) if d in has_original else None for s, d in zip(original_scores, draft_ids)],
+        majority_scores.tolist(),
+    )
@@ -0,0 +1,195 @@
+import concurrent.futures
+import json
+import math
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from eightpack.config import app_config
+from eightpack.data import ScryfallCard
+from eightpack.util import remove_face2
+
+# Scryfall doesn't accept more identifiers than this in one /cards/collection request
+COLLECTION_SIZE = 75
+
+
+class RateLimiter:
+    """
+    Spaces out calls made from any number of threads by at least `interval` seconds.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.next_call = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = max(0.0, self.next_call - now)
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay:
+            time.sleep(delay)
+
+
+class CardCache:
+    """
+    On-disk cache of Scryfall card objects, stored as one JSON file per set and keyed by card name
+    (without the second face, which is how 17lands names cards). Names that Scryfall doesn't know
+    are cached too, so that they aren't requested again on every import.
+    """
+
+    def __init__(self, directory: str, ttl: float, *, refresh: bool = False):
+        self.directory = directory
+        self.ttl = ttl
+        self.refresh = refresh
+
+    def _path(self, set_code: str) -> str:
+        return os.path.join(self.directory, f"{set_code.lower()}.json")
+
+    def _load(self, set_code: str) -> dict:
+        try:
+            with open(self._path(set_code)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"complete_at": None, "cards": {}}
+
+    def _save(self, set_code: str, contents: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(set_code)
+        # several imports can run at once, and The List cards are shared between them
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(contents, f)
+        os.replace(temp_path, path)
+
+    def _is_fresh(self, timestamp: float | None) -> bool:
+        return not self.refresh and timestamp is not None and time.time() - timestamp < self.ttl
+
+    def get_set(self, set_code: str) -> list[dict] | None:
+        contents = self._load(set_code)
+        if not self._is_fresh(contents["complete_at"]):
+            return None
+        return [e["card"] for e in contents["cards"].values() if e["card"] is not None]
+
+    def put_set(self, set_code: str, cards: list[dict]):
+        now = time.time()
+        contents = {"complete_at": now, "cards": {}}
+        for c in cards:
+            contents["cards"][remove_face2(c["name"])] = {"fetched_at": now, "card": c}
+        self._save(set_code, contents)
+
+    def get_named(self, set_code: str, names: list[str]) -> tuple[list[dict], list[str]]:
+        """
+        Returns the cached cards and the names that have to be fetched.
+        """
+
+        entries = self._load(set_code)["cards"]
+        found, missing = [], []
+        for name in names:
+            entry = entries.get(name)
+            if entry is None or not self._is_fresh(entry["fetched_at"]):
+                missing.append(name)
+            elif entry["card"] is not None:
+                found.append(entry["card"])
+        return found, missing
+
+    def put_named(self, set_code: str, names: list[str], cards: list[dict]):
+        now = time.time()
+        contents = self._load(set_code)
+        for name in names:
+            contents["cards"][name] = {"fetched_at": now, "card": None}
+        for c in cards:
+            contents["cards"][remove_face2(c["name"])] = {"fetched_at": now, "card": c}
+        self._save(set_code, contents)
+
+
+class ScryfallClient:
+    """
+    Scryfall API client. All requests share one pooled session, failed requests are retried
+    with backoff, and independent requests run concurrently while staying under the rate limit.
+    """
+
+    def __init__(
+        self,
+        base_url: str | None = None,
+        *,
+        cache: CardCache | None = None,
+        workers: int | None = None,
+        interval: float | None = None,
+    ):
+        self.base_url = (base_url or app_config.SCRYFALL_URL).rstrip("/")
+        self.cache = cache
+        self.workers = workers or app_config.SCRYFALL_WORKERS
+        self.rate_limiter = RateLimiter(
+            interval if interval is not None else app_config.SCRYFALL_REQUEST_INTERVAL
+        )
+
+        retries = Retry(
+            total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=None
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers, max_retries=retries)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": "8pack", "Accept": "application/json"})
+
+    @classmethod
+    def from_config(cls, *, refresh: bool = False) -> "ScryfallClient":
+        cache = CardCache(app_config.SCRYFALL_CACHE_DIR, app_config.SCRYFALL_CACHE_TTL, refresh=refresh)
+        return cls(cache=cache)
+
+    def request(self, method: str, url: str, **kwargs) -> dict:
+        self.rate_limiter.wait()
+        response = self.session.request(method, self.base_url + url, timeout=30, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def map(self, fn, items: list) -> list:
+        if len(items) <= 1:
+            return [fn(i) for i in items]
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            return list(pool.map(fn, items))
+
+    def search(self, query: str) -> list[dict]:
+        # The first page tells us how many pages there are, so the rest can be fetched at the same time
+        first_page = self.request("GET", "/cards/search", params={"q": query})
+        cards = first_page["data"]
+        if not first_page.get("has_more"):
+            return cards
+
+        page_count = math.ceil(first_page["total_cards"] / len(cards))
+        pages = self.map(
+            lambda page: self.request("GET", "/cards/search", params={"q": query, "page": page})["data"],
+            list(range(2, page_count + 1)),
+        )
+        return cards + [c for page in pages for c in page]
+
+    def collection(self, identifiers: list[dict]) -> list[dict]:
+        chunks = [identifiers[i : i + COLLECTION_SIZE] for i in range(0, len(identifiers), COLLECTION_SIZE)]
+        pages = self.map(
+            lambda chunk: self.request("POST", "/cards/collection", json={"identifiers": chunk}), chunks
+        )
+        return [c for page in pages for c in page["data"]]
+
+    def set_cards(self, set_code: str) -> list[ScryfallCard]:
+        cards = self.cache.get_set(set_code) if self.cache else None
+        if cards is None:
+            cards = self.search(f"set:{set_code}")
+            if self.cache:
+                self.cache.put_set(set_code, cards)
+        return [ScryfallCard(**c) for c in cards]
+
+    def named_cards(self, set_code: str, names: list[str]) -> list[ScryfallCard]:
+        names = [remove_face2(n) for n in names]
+        cards, missing = self.cache.get_named(set_code, names) if self.cache else ([], names)
+        if missing:
+            fetched = self.collection([{"name": n, "set": set_code} for n in missing])
+            if self.cache:
+                self.cache.put_named(set_code, missing, fetched)
+            cards += fetched
+        return [ScryfallCard(**c) for c in cards]
@@ -0,0 +1,299 @@
+import asyncio
+import contextlib
+import fcntl
+import json
+import logging
+import mmap
+import os
+from typing import Callable, Iterator
+
+import numpy
+from sqlalchemy import Connection, select
+
+from eightpack import data, model
+from eightpack.core import run_in_transaction
+
+logger = logging.getLogger(__name__)
+TURNS = 8
+CARD_FIELDS = ["id", "name", "image", "art_image", "slug", "set"]
+# arrays in a snapshot file start at multiples of this
+ALIGNMENT = 64
+
+
+def aligned(size: int) -> int:
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def current_generation(conn: Connection) -> str | None:
+    query = select(model.ImportGeneration.token).order_by(model.ImportGeneration.id.desc()).limit(1)
+    return conn.execute(query).scalar()
+
+
+class Snapshot:
+    """
+    Everything that only changes with an import (cards, drafts and their options), loaded into memory.
+    The options of all drafts are stored in one array, ordered by draft, turn and option, and
+    `turn_offsets[i * TURNS + t]` is where turn `t` of the i-th draft starts. Run counts are the only part
+    that changes between imports, they're kept up to date by ReadModel.
+    A snapshot can be saved to a file and memory-mapped from it, so that processes opening the same file
+    share the arrays instead of each having a copy.
+    """
+
+    def __init__(self, generation: str | None, cards: list[dict], player_names: list[str], **arrays):
+        self.generation = generation
+        self.card_rows = cards
+        self.cards = {c["id"]: data.CardResponse.model_validate(c) for c in cards}
+        self.card_sets = {c["id"]: c["set"] for c in cards}
+        self.player_names = player_names
+        self.draft_ids: numpy.ndarray = arrays["draft_ids"]
+        self.created_at: numpy.ndarray = arrays["created_at"]
+        self.front_card_ids: numpy.ndarray = arrays["front_card_ids"]
+        # index of the name of the draft's first player in player_names
+        self.player_index: numpy.ndarray = arrays["player_index"]
+        self.option_cards: numpy.ndarray = arrays["option_cards"]
+        self.turn_offsets: numpy.ndarray = arrays["turn_offsets"]
+        self.run_counts: dict[int, int] = {}
+
+    @property
+    def arrays(self) -> dict[str, numpy.ndarray]:
+        names = ["draft_ids", "created_at", "front_card_ids", "player_index", "option_cards", "turn_offsets"]
+        return {name: getattr(self, name) for name in names}
+
+    @classmethod
+    def from_database(cls, conn: Connection) -> "Snapshot":
+        generation = current_generation(conn)
+        cards = conn.execute(select(*(model.Card.__table__.c[f] for f in CARD_FIELDS))).all()
+        drafts = conn.execute(
+            select(model.Draft.id, model.Draft.created_at, model.Draft.front_card_id, model.Player.name)
+            .join(model.Player, model.Draft.first_player_id == model.Player.id)
+            .order_by(model.Draft.id)
+        ).all()
+        # there are few different names, so they are stored once
+        player_names: dict[str, int] = {}
+        player_index = [player_names.setdefault(d[3], len(player_names)) for d in drafts]
+
+        draft_ids = numpy.array([d[0] for d in drafts], dtype=numpy.int64)
+        options = numpy.array(
+            conn.execute(
+                select(
+                    model.DraftOption.draft_id, model.DraftOption.turn_number, model.DraftOption.card_id
+                ).order_by(
+                    model.DraftOption.draft_id, model.DraftOption.turn_number, model.DraftOption.option_number
+                )
+            ).all(),
+            dtype=numpy.int64,
+        ).reshape(-1, 3)
+        keys = numpy.searchsorted(draft_ids, options[:, 0]) * TURNS + options[:, 1]
+        snapshot = cls(
+            generation,
+            [dict(zip(CARD_FIELDS, c)) for c in cards],
+            list(player_names),
+            draft_ids=draft_ids,
+            created_at=numpy.array([d[1] for d in drafts], dtype="datetime64[us]"),
+            front_card_ids=numpy.array([d[2] for d in drafts], dtype=numpy.int32),
+            player_index=numpy.array(player_index, dtype=numpy.int32),
+            option_cards=options[:, 2].astype(numpy.int32),
+            turn_offsets=numpy.searchsorted(keys, numpy.arange(len(drafts) * TURNS + 1)),
+        )
+        snapshot.refresh_run_counts(conn)
+        return snapshot
+
+    def save(self, path: str):
+        """
+        Writes the snapshot as a length-prefixed JSON header followed by the raw arrays. The file is replaced
+        atomically, processes that have the old one open keep using it.
+        """
+
+        layout, offset = {}, 0
+        for name, array in self.arrays.items():
+            layout[name] = {"dtype": array.dtype.str, "shape": array.shape, "offset": offset}
+            offset += aligned(array.nbytes)
+        header = json.dumps(
+            {
+                "generation": self.generation,
+                "cards": self.card_rows,
+                "player_names": self.player_names,
+                "arrays": layout,
+            }
+        ).encode("utf-8")
+        data_start = aligned(8 + len(header))
+
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for name, array in self.arrays.items():
+                f.seek(data_start + layout[name]["offset"])
+                f.write(numpy.ascontiguousarray(array).tobytes())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def open(cls, path: str) -> "Snapshot":
+        """
+        Memory-maps a saved snapshot. The arrays are read-only views of the file.
+        """
+
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header_size = int.from_bytes(mapped[:8], "little")
+        header = json.loads(mapped[8 : 8 + header_size])
+        data_start = aligned(8 + header_size)
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            shape = tuple(spec["shape"])
+            array = numpy.frombuffer(
+                mapped, dtype=spec["dtype"], count=int(numpy.prod(shape)), offset=data_start + spec["offset"]
+            )
+            arrays[name] = array.reshape(shape)
+        return cls(header["generation"], header["cards"], header["player_names"], **arrays)
+
+    def refresh_run_counts(self, conn: Connection):
+        self.run_counts = dict(conn.execute(select(model.Draft.id, model.Draft.run_count)).all())
+
+    def _index_of(self, draft_id: int) -> int | None:
+        i = int(numpy.searchsorted(self.draft_ids, draft_id))
+        return i if i < len(self.draft_ids) and self.draft_ids[i] == draft_id else None
+
+    def _draft_response(self, i: int) -> data.DraftResponse:
+        draft_id = int(self.draft_ids[i])
+        return data.DraftResponse(
+            id=draft_id,
+            date=self.created_at[i].item(),
+            front_card=self.cards[int(self.front_card_ids[i])],
+            run_count=self.run_counts.get(draft_id, 0),
+            player_name=self.player_names[self.player_index[i]],
+        )
+
+    def drafts_page(
+        self, pagination: data.PaginationRequest, default_page_size: int
+    ) -> data.PaginationResponse[data.DraftResponse]:
+        # same order as the database version: newest (highest ID) first
+        page_size = pagination.get_page_size(default_page_size)
+        if pagination.cursor is not None:
+            end = int(numpy.searchsorted(self.draft_ids, pagination.cursor))
+            total = None
+        else:
+            end = len(self.draft_ids) - page_size * pagination.page_num
+            total = len(self.draft_ids)
+        items = [self._draft_response(i) for i in range(end - 1, max(0, end - page_size) - 1, -1)]
+        return data.PaginationResponse(
+            total_objects=total, data=items, next_cursor=data.next_cursor_of(items, page_size)
+        )
+
+    def turns(self, draft_id: int) -> list[list[int]] | None:
+        if (i := self._index_of(draft_id)) is None:
+            return None
+        offsets = self.turn_offsets[i * TURNS : (i + 1) * TURNS + 1]
+        return [self.option_cards[offsets[t] : offsets[t + 1]].tolist() for t in range(TURNS)]
+
+    def choices(
+        self, draft_id: int, response_format: data.ResponseFormat, with_cards: bool = True
+    ) -> data.DraftChoicesResponse | data.CompactDraftChoicesResponse | None:
+        if (turns := self.turns(draft_id)) is None:
+            return None
+        if response_format == data.ResponseFormat.compact:
+            cards = {c: self.cards[c] for turn in turns for c in turn} if with_cards else None
+            return data.CompactDraftChoicesResponse(cards=cards, turns=turns)
+        return data.DraftChoicesResponse(cards=[[self.cards[c] for c in turn] for turn in turns])
+
+    def card_catalog(self, set_code: str | None) -> data.CardCatalogResponse:
+        cards = {
+            card_id: card
+            for card_id, card in sorted(self.cards.items())
+            if set_code is None or self.card_sets[card_id] == set_code
+        }
+        return data.CardCatalogResponse(cards=cards)
+
+
+@contextlib.contextmanager
+def locked(path: str) -> Iterator[None]:
+    # held by one process at a time, on any number of hosts sharing the file system
+    with open(f"{path}.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load_snapshot(conn: Connection, path: str | None = None) -> Snapshot:
+    """
+    Builds a snapshot of the database or, with a path, maps the snapshot file if it's of the current import.
+    Otherwise the file is (re)written first, by only one of the processes sharing it.
+    """
+
+    if path is None:
+        return Snapshot.from_database(conn)
+
+    generation = current_generation(conn)
+    with locked(path):
+        snapshot = Snapshot.open(path) if os.path.exists(path) else None
+        if snapshot is None or snapshot.generation != generation:
+            logger.info("Writing the snapshot of import %s to %s", generation, path)
+            Snapshot.from_database(conn).save(path)
+            snapshot = Snapshot.open(path)
+    snapshot.refresh_run_counts(conn)
+    return snapshot
+
+
+class ReadModel:
+    """
+    Follows the import generation, checking every `check_interval` seconds whether a new import is
+    finished, and calls the reload callbacks when it is. With `use_snapshot`, it also holds the current
+    Snapshot, replaces it after an import and refreshes its run counts on every check. With a path,
+    the snapshot is shared through that file with the other processes using it.
+    """
+
+    def __init__(self, check_interval: float, path: str | None = None):
+        self.check_interval = check_interval
+        self.path = path
+        self.generation: str | None = None
+        self.snapshot: Snapshot | None = None
+        self.task: asyncio.Task | None = None
+        self.reload_callbacks: list[Callable[[], None]] = []
+
+    async def start(self, use_snapshot: bool = True):
+        if use_snapshot:
+            self.snapshot = await run_in_transaction(load_snapshot, self.path)
+            self.generation = self.snapshot.generation
+        else:
+            self.generation = await run_in_transaction(current_generation)
+        self.task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+        self.task = self.snapshot = self.generation = None
+
+    def on_reload(self, callback: Callable[[], None]):
+        self.reload_callbacks.append(callback)
+
+    def add_run(self, draft_id: int):
+        if self.snapshot is not None and draft_id in self.snapshot.run_counts:
+            self.snapshot.run_counts[draft_id] += 1
+
+    async def check(self):
+        generation = await run_in_transaction(current_generation)
+        if generation == self.generation:
+            if self.snapshot is not None:
+                await run_in_transaction(self.snapshot.refresh_run_counts)
+            return
+
+        logger.info("Import generation changed to %s", generation)
+        if self.snapshot is not None:
+            # the old snapshot keeps serving requests until the new one is complete
+            self.snapshot = await run_in_transaction(load_snapshot, self.path)
+            generation = self.snapshot.generation
+        self.generation = generation
+        for callback in self.reload_callbacks:
+            callback()
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Checking the import generation failed")
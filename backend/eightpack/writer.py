@@ -0,0 +1,135 @@
+import asyncio
+import collections
+import contextlib
+import dataclasses
+import logging
+
+from sqlalchemy import Connection, bindparam, insert, update
+
+from eightpack import aggregates, bulk, model, scoring
+from eightpack.core import run_in_transaction
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class Playthrough:
+    draft_id: int
+    player_id: int
+    # IDs of the picked cards, in order
+    picks: tuple[int, ...]
+
+
+def insert_playthroughs(conn: Connection, playthroughs: list[Playthrough]) -> list[int]:
+    """
+    Inserts the runs with their picks, updates the run counts and pick counts of their drafts,
+    and scores the new runs.
+    Returns the IDs of the new runs.
+    """
+
+    run_table = model.DraftRun.__table__
+    draft_table = model.Draft.__table__
+    result = conn.execute(
+        insert(run_table).returning(run_table.c.id, sort_by_parameter_order=True),
+        [{"draft_id": p.draft_id, "player_id": p.player_id} for p in playthroughs],
+    )
+    run_ids = list(result.scalars())
+
+    picks = (
+        (run_id, turn, card_id)
+        for run_id, p in zip(run_ids, playthroughs)
+        for turn, card_id in enumerate(p.picks)
+    )
+    bulk.insert_rows(
+        conn, model.DraftPick.__table__, ["draft_run_id", "turn_number", "picked_card_id"], picks
+    )
+
+    new_runs = collections.Counter(p.draft_id for p in playthroughs)
+    conn.execute(
+        update(draft_table)
+        .where(draft_table.c.id == bindparam("b_id"))
+        .values(run_count=draft_table.c.run_count + bindparam("b_count")),
+        [{"b_id": draft_id, "b_count": count} for draft_id, count in new_runs.items()],
+    )
+    aggregates.add_pick_counts(conn, [(p.draft_id, p.picks) for p in playthroughs])
+    scoring.score_new_runs(conn, run_ids, [p.draft_id for p in playthroughs], [p.picks for p in playthroughs])
+    return run_ids
+
+
+class PlaythroughWriter:
+    """
+    Write-behind queue for saved playthroughs. Playthroughs arriving within `window` seconds of each other
+    (up to `max_batch` of them) are inserted in a single transaction, and `save` only returns once
+    the transaction of its playthrough has been committed.
+    """
+
+    def __init__(self, window: float, max_batch: int):
+        self.window = window
+        self.max_batch = max_batch
+        self.queue: asyncio.Queue[tuple[Playthrough, asyncio.Future]] | None = None
+        self.task: asyncio.Task | None = None
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is None:
+            return
+        await self.queue.join()
+        self.task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self.task
+        self.queue = self.task = None
+
+    async def save(self, playthrough: Playthrough) -> int:
+        if self.queue is None:
+            raise RuntimeError("PlaythroughWriter is not started!")
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((playthrough, future))
+        return await future
+
+    async def _collect(self) -> list[tuple[Playthrough, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write(self, batch: list[tuple[Playthrough, asyncio.Future]]):
+        try:
+            run_ids = await run_in_transaction(insert_playthroughs, [p for p, _ in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                # one bad playthrough (e.g. of a draft that doesn't exist) shouldn't fail the whole batch
+                logger.warning("Writing %d playthroughs failed, retrying one by one: %s", len(batch), e)
+                for item in batch:
+                    await self._write([item])
+            elif not batch[0][1].done():
+                batch[0][1].set_exception(e)
+            return
+
+        for (_, future), run_id in zip(batch, run_ids):
+            if not future.done():
+                future.set_result(run_id)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
@@ -0,0 +1,93 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from eightpack import app as app_module
+from eightpack import magic, migrations, model
+from eightpack.config import app_config
+from eightpack.core import EngineGlobal
+from eightpack.scoring import TURNS
+
+DRAFTS = 5
+RUNS_PER_DRAFT = 3
+OPTIONS_PER_TURN = 14
+
+
+def make_drafts(player: model.Player) -> magic.ParsedSet:
+    """
+    A few drafts over a small made-up set, with several runs each so that N+1 queries show up.
+    """
+
+    cards = [
+        model.Card(
+            name=f"Card {i}",
+            image=f"https://cards.example/large/{i}.jpg",
+            art_image=f"https://cards.example/art_crop/{i}.jpg",
+            slug=f"card-{i}",
+            layout="normal",
+            rarity="common",
+            set="tst",
+        )
+        for i in range(OPTIONS_PER_TURN + TURNS)
+    ]
+    parsed = magic.ParsedSet(cards=cards)
+    for d in range(DRAFTS):
+        options = [
+            model.DraftOption(turn_number=t, option_number=o, card=cards[(d + t + o) % len(cards)])
+            for t in range(TURNS)
+            for o in range(OPTIONS_PER_TURN - t)
+        ]
+        runs = [
+            model.DraftRun(
+                player=player,
+                is_original=r == 0,
+                draft_picks=[
+                    model.DraftPick(turn_number=t, picked_card=cards[(d + t + r) % len(cards)])
+                    for t in range(TURNS)
+                ],
+            )
+            for r in range(RUNS_PER_DRAFT)
+        ]
+        parsed.drafts.append(
+            model.Draft(
+                draft_options=options,
+                draft_runs=runs,
+                front_card=cards[d],
+                first_player=player,
+                source_id=f"draft-{d}",
+            )
+        )
+    return parsed
+
+
+@pytest.fixture(scope="session")
+def db_url(tmp_path_factory) -> str:
+    url = f"sqlite:///{tmp_path_factory.mktemp('db') / 'eightpack.sqlite'}"
+    player = model.Player(login="$test", name="a test player", password="", virtual=True)
+    EngineGlobal.setup(url)
+    with EngineGlobal.engine.begin() as conn:
+        migrations.upgrade(conn)
+        magic.load_drafts(conn, player, make_drafts(player))
+    EngineGlobal.destroy()
+    return url
+
+
+@pytest.fixture(params=[False, True], ids=["sync", "async"])
+def client(request, db_url: str):
+    """
+    The API on the test database, with the sync and the async engine.
+    """
+
+    previous = app_config.DB_URL, app_config.DB_ASYNC
+    app_config.DB_URL, app_config.DB_ASYNC = db_url, request.param
+    app_module.choices_cache.clear()
+    app_module.catalog_cache.clear()
+    try:
+        with TestClient(app_module.app) as c:
+            yield c
+    finally:
+        app_config.DB_URL, app_config.DB_ASYNC = previous
+
+
+@pytest.fixture
+def draft_id(client: TestClient) -> int:
+    return client.get("/drafts").json()["data"][0]["id"]
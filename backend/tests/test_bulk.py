@@ -0,0 +1,20 @@
+import pytest
+from sqlalchemy import create_engine, select
+
+from eightpack import bulk, model
+
+TABLE = model.DraftPickCount.__table__
+KEY = ["draft_id", "turn_number", "card_id"]
+
+
+@pytest.mark.parametrize(
+    "increment", [bulk.increment_rows, bulk._increment_each_row], ids=["upsert", "fallback"]
+)
+def test_increment_rows(increment):
+    engine = create_engine("sqlite://")
+    TABLE.create(engine)
+    with engine.begin() as conn:
+        increment(conn, TABLE, KEY, "count", [(1, 0, 5, 1), (1, 0, 6, 2)])
+        increment(conn, TABLE, KEY, "count", [(1, 0, 5, 3), (2, 1, 5, 1)])
+        counts = conn.execute(select(TABLE).order_by(*(TABLE.c[c] for c in KEY))).all()
+    assert counts == [(1, 0, 5, 4), (1, 0, 6, 2), (2, 1, 5, 1)]
@@ -0,0 +1,25 @@
+from fastapi.testclient import TestClient
+
+from tests.conftest import DRAFTS, RUNS_PER_DRAFT
+
+
+def test_drafts_cursor_ends_on_short_page(client: TestClient):
+    page_size = DRAFTS - 2
+    first = client.get(f"/drafts?page_size={page_size}").json()
+    assert len(first["data"]) == page_size
+    assert first["next_cursor"] == first["data"][-1]["id"]
+
+    last = client.get(f"/drafts?page_size={page_size}&cursor={first['next_cursor']}").json()
+    assert len(last["data"]) == DRAFTS - page_size
+    assert last["next_cursor"] is None
+
+
+def test_playthroughs_cursor_ends_on_short_page(client: TestClient, draft_id: int):
+    first = client.get(f"/drafts/{draft_id}/playthroughs?page_size={RUNS_PER_DRAFT - 1}").json()
+    assert first["next_cursor"] == first["playthroughs"][-1]["id"]
+
+    last = client.get(
+        f"/drafts/{draft_id}/playthroughs?page_size={RUNS_PER_DRAFT - 1}&cursor={first['next_cursor']}"
+    ).json()
+    assert len(last["playthroughs"]) == 1
+    assert last["next_cursor"] is None
@@ -0,0 +1,75 @@
+"""
+The endpoints that list drafts and their runs have to load the related rows eagerly, these fail
+if one of them starts running a query per item again.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from eightpack import app as app_module
+from eightpack import metrics, model
+from eightpack.querycount import query_budget
+from eightpack.scoring import TURNS
+
+from tests.conftest import DRAFTS, RUNS_PER_DRAFT
+
+FORMATS = ["format=full", "format=compact", "format=compact&cards=omit"]
+
+
+def test_drafts(client: TestClient):
+    # the page and the total count
+    with query_budget(2):
+        response = client.get("/drafts")
+    assert len(response.json()["data"]) == DRAFTS
+
+
+@pytest.mark.parametrize("format_query", FORMATS)
+def test_choices(client: TestClient, draft_id: int, format_query: str):
+    with query_budget(1):
+        response = client.get(f"/drafts/{draft_id}/choices?{format_query}")
+    assert response.status_code == 200
+
+    # served from the cache afterwards
+    with query_budget(0):
+        client.get(f"/drafts/{draft_id}/choices?{format_query}")
+
+    # the ETag only depends on the import, so revalidating doesn't need the choices
+    app_module.choices_cache.clear()
+    with query_budget(0):
+        revalidated = client.get(
+            f"/drafts/{draft_id}/choices?{format_query}",
+            headers={"If-None-Match": response.headers["ETag"]},
+        )
+    assert revalidated.status_code == 304
+
+
+def test_cards(client: TestClient):
+    with query_budget(1):
+        response = client.get("/cards")
+    assert response.json()["cards"]
+
+    app_module.catalog_cache.clear()
+    with query_budget(0):
+        revalidated = client.get("/cards", headers={"If-None-Match": response.headers["ETag"]})
+    assert revalidated.status_code == 304
+
+
+@pytest.mark.parametrize("format_query", FORMATS)
+def test_playthroughs(client: TestClient, draft_id: int, format_query: str):
+    # the runs and their picks
+    with query_budget(2):
+        response = client.get(f"/drafts/{draft_id}/playthroughs?{format_query}")
+    assert len(response.json()["playthroughs"]) == RUNS_PER_DRAFT
+
+
+def test_budget_catches_lazy_loading(db_url: str):
+    engine = create_engine(db_url)
+    metrics.instrument_engine(engine)
+    with pytest.raises(AssertionError, match=f"ran this {RUNS_PER_DRAFT} times"):
+        with query_budget(10), Session(engine) as session:
+            draft = session.scalars(select(model.Draft).limit(1)).one()
+            for run in draft.draft_runs:
+                assert len(run.draft_picks) == TURNS
+    engine.dispose()
@@ -8,8 +8,11 @@ export const useDraftStore = defineStore("draft", () => {
     const current_picks = ref([])
     const current_draft_plays = ref([])
     const loading_count = ref(0)
+    // incremented by every reload, responses to the requests of an earlier reload are dropped
+    let reload_token = 0
     const reload = () => {
         const id = current_draft_id.value
+        const token = ++reload_token
         current_draft_choices.value = null
         current_picks.value = []
         current_draft_plays.value = []
@@ -17,14 +20,23 @@ export const useDraftStore = defineStore("draft", () => {
         get(`drafts/${id}/choices`)
             .then((e) => e.json())
             .then((e) => {
+                if (token !== reload_token) return
                 current_draft_choices.value = e.cards
                 loading_count.value -= 1
             })
-        get(`drafts/${id}/playthroughs`)
+        load_playthroughs(token, id, null, [])
+    }
+    // every reload builds its own list from the pages it loaded, which replaces the shown one
+    const load_playthroughs = (token, id, cursor, loaded) => {
+        const query = cursor === null ? "" : `?cursor=${cursor}`
+        get(`drafts/${id}/playthroughs${query}`)
             .then((e) => e.json())
             .then((e) => {
-                current_draft_plays.value = e.playthroughs
-                loading_count.value -= 1
+                if (token !== reload_token) return
+                const plays = loaded.concat(e.playthroughs)
+                current_draft_plays.value = plays
+                if (e.next_cursor === null) loading_count.value -= 1
+                else load_playthroughs(token, id, e.next_cursor, plays)
             })
     }
     const load = (id) => {
@@ -33,6 +33,15 @@ export function auth_post(url, body = {}, headers = {}) {
     return post(url, body, auth.token, headers)
 }
 
+// card images are downloaded, resized and cached by the backend
+export function card_image(card, width = 244) {
+    return `${BACKEND_URL}/cards/${card.id}/image?width=${width}`
+}
+
+export function card_art(card) {
+    return `${BACKEND_URL}/cards/${card.id}/image?kind=art`
+}
+
 export function humanize_date(date) {
     return DateTime.fromISO(date, { zone: "UTC" }).setZone().toLocaleString(DateTime.DATETIME_SHORT)
 }